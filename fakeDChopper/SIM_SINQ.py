@@ -4,162 +4,222 @@
 #
 # modified for SINQ chopper, Mark Koennecke (mark.koennecke@psi.ch)
 # We simulate 3 minutes for each chopper change.... 
+#
+# The chopper is kept by the factory, so all connections see the same
+# one. A change of speed or phase is a linear ramp which is evaluated
+# when a status is asked for. The lines of the status reply follow each
+# other 0.1 s apart like on the real controller. The replies of a
+# connection go through a queue which is drained from the reactor one
+# line at a time, so a status request blocks no other client and the
+# replies keep the order of the requests.
 #----------------------------------------------------------------------
 from twisted.internet import reactor, protocol
 from twisted.protocols.basic import LineReceiver
-import time
+from collections import deque
+import os
+import sys
+sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(__file__),"../util"))))
+from simlog import getLogger
 
-class Astrium_Chopper(LineReceiver):
-    def __init__(self):
-        print dir(self)
-        print dir(self.transport)
-        self.delimiter = '\r\n'
-        self.speed = 4
-        self.target = 4
-        self.oldspeed = 4
-        self.speed2 = 4
-        self.target2 = 4
-        self.oldspeed2 = 4
-        self.speedchange = time.time() - 200
-        self.ratio = 1
-        self.phase = 12.8
-        self.oldphase = 12.8
-        self.targetphase = 12.8
-        self.phasechange = self.speedchange
-        self.dphas = .0
+log = getLogger("sinqchopper")
 
-        # Number of seconds for a state change
-        self.time_compression = 40.0
+# seconds between the lines of a status reply
+LINE_DELAY = 0.1
 
+class Ramp(object):
+    """
+    A value changing linearly to a target within duration seconds
+    """
+    def __init__(self, value, duration):
+        self.start = value
+        self.target = value
+        self.t0 = 0.
+        self.duration = duration
 
-    def write(self, data):
-        print "transmitted:", data
-        self.transport.write(data)
-
-    def calculatespeed(self):
-        if time.time() < self.speedchange + self.time_compression:
-            diff = time.time() - self.speedchange
-            frac = diff / self.time_compression
-            self.speed = int(self.oldspeed + frac*(self.target - self.oldspeed))
-            self.speed2 = int(self.oldspeed + frac*(self.target2 - self.oldspeed2))
-        else:
-            self.speed = self.target
-            self.speed2 = self.target2
-            self.oldspeed = self.speed
-            self.oldspeed2 = self.speed2
-
-    def calculatephase(self):
-        fr = (time.time() - self.phasechange) / self.time_compression
-        print('fr: {:.4f}'.format(fr))
+    def value(self, t):
+        fr = (t - self.t0) / self.duration
         if fr < 0:
             # should not happen except in rare leap second cases
-            pass
+            return self.start
         elif fr < 1:
-            self.dphas = (1-fr) * self.oldphase + fr * self.targetphase
-        else:
-            self.dphas = self.targetphase
-            self.oldphase = self.dphas
-        
+            return (1-fr) * self.start + fr * self.target
+        return self.target
 
-    def lineReceived(self, data):
-        print "lineReceived:", data
-        if data.startswith("asyst 1"):
-            self.calculatespeed()
-            self.calculatephase()
-            self.write('asyst 1         ......valid\r\n')
-            time.sleep(0.1)
-            self.write(\
+    def set(self, target, t):
+        self.start = self.value(t)
+        self.target = target
+        self.t0 = t
+
+class Chopper(object):
+    """
+    State of the two discs of the chopper
+    """
+    def __init__(self, clock=reactor):
+        self.clock = clock
+        # Number of seconds for a state change
+        self.time_compression = 40.0
+        self.speed = Ramp(4, self.time_compression)
+        self.speed2 = Ramp(4, self.time_compression)
+        self.phase = Ramp(12.8, self.time_compression)
+        self.ratio = 1
+
+    def status(self):
+        """The two status lines of asyst 1, as of now"""
+        t = self.clock.seconds()
+        return [
                 'chopp_1;state async;amode Regel;nspee  ' \
-                    + str(self.target) + \
+                    + str(self.speed.target) + \
                     ';aspee  ' +\
-                    str(self.speed) +\
+                    str(int(self.speed.value(t))) +\
                     ';nphas   0.0;dphas  0.0;averl 5.2;spver  1996;'+\
                     'ratio 1;no_action   ;monit_1;vibra  0.2;'+\
-                    't_cho   0.0;durch  0.0;vakum  0.0010;valve 0;sumsi 0;\r\n')
-            time.sleep(0.1)
-            self.write(\
+                    't_cho   0.0;durch  0.0;vakum  0.0010;valve 0;sumsi 0;\r\n',
                 'chopp_2;state synch;amode Kalib;nspee  ' +\
-                    str(self.target2) +\
+                    str(self.speed2.target) +\
                     ';aspee  ' +\
-                    str(self.speed2) +\
-                    ';nphas' + '%7.2f' % (self.targetphase) +
-                    ';dphas' + '%7.2f' % (self.dphas) +
+                    str(int(self.speed2.value(t))) +\
+                    ';nphas' + '%7.2f' % (self.phase.target) +
+                    ';dphas' + '%7.2f' % (self.phase.value(t)) +
                     ';averl 4.0;spver  1996;ratio '+\
                     str(self.ratio) + ';no_action   ;monit_2;vibra  0.2;t_cho   0.0;' +\
-                    'durch  0.0;vakum  0.0010;valve 0;sumsi 0;\r\n')
+                    'durch  0.0;vakum  0.0010;valve 0;sumsi 0;\r\n']
+
+    def setspeed(self, idx, val):
+        t = self.clock.seconds()
+        if idx == 1:
+            self.speed.set(val, t)
+            self.speed2.set(int(val/self.ratio), t)
+        else:
+            self.speed2.set(val, t)
+
+    def setratio(self, r):
+        self.ratio = r
+        self.speed2.set(self.speed.target/r, self.clock.seconds())
+
+    def setphase(self, ph):
+        self.phase.set(ph, self.clock.seconds())
+
+class Astrium_Chopper(LineReceiver):
+    def __init__(self, chopper=None):
+        if chopper is None:
+            chopper = Chopper()
+        self.delimiter = '\r\n'
+        self.chopper = chopper
+        self.clock = chopper.clock
+        # (delay, line) of the replies not yet written
+        self.queue = deque()
+        self.call = None
+
+    def write(self, data):
+        log.debug("transmitted: %s", data)
+        if self.transport is not None:
+            self.transport.write(data)
+
+    def send(self, data, delay=0.):
+        """Writes data delay seconds after the reply line before"""
+        self.queue.append((delay, data))
+        if self.call is None:
+            self.drain()
+
+    def drain(self):
+        """Writes the queued lines up to the next one with a delay, which
+        is scheduled only when the line before it was written"""
+        while self.queue and self.call is None:
+            delay, data = self.queue.popleft()
+            if delay > 0:
+                self.call = self.clock.callLater(delay, self.delayed, data)
+            else:
+                self.write(data)
+
+    def delayed(self, data):
+        self.call = None
+        self.write(data)
+        self.drain()
+
+    def lineReceived(self, data):
+        log.debug("lineReceived: %s", data)
+        if data.startswith("asyst 1"):
+            self.send('asyst 1         ......valid\r\n')
+            for line in self.chopper.status():
+                self.send(line, LINE_DELAY)
             return
         if data.startswith("nspee"):
             par = data.split()
             if len(par) < 3:
-                self.write('not valid\r\n')
+                self.send('not valid\r\n')
                 return
             if par[1].isdigit():
                 idx = int(par[1])
                 if idx < 1 or idx > 2:
-                    self.write('not valid\r\n')
+                    self.send('not valid\r\n')
                     return
                 if par[2].isdigit():
                     val = int(par[2])
                 else:
-                    self.write('not valid\r\n')
+                    self.send('not valid\r\n')
                     return
-                if idx == 1:
-                    self.oldspeed = self.speed
-                    self.target = val
-                    self.oldspeed2 = self.speed2
-                    self.target2 = int(val/self.ratio)
-                else :
-                    self.oldspeed2 = self.speed2
-                    self.target2 = val
-                self.write('valid\r\n')
-                self.speedchange = time.time()
+                self.chopper.setspeed(idx, val)
+                self.send('valid\r\n')
             else:
-                self.write('not valid\r\n')
+                self.send('not valid\r\n')
             return
         if data.startswith("ratio 2"):
             par = data.split()
             if len(par) < 3:
-                print(len(par), par)
-                self.write('not valid\r\n')
+                log.debug('Too few parameters: %s', par)
+                self.send('not valid\r\n')
                 return
             if par[2].isdigit():
                 r = int(par[2])
-                if r < 0 or r > 5:
-                    self.write('not valid\r\n')
+                if r < 1 or r > 5:
+                    self.send('not valid\r\n')
                     return
-                self.ratio = r
-                self.target2 = self.target/r
-                self.speedchange = time.time()
-                self.write('valid\r\n')
+                self.chopper.setratio(r)
+                self.send('valid\r\n')
             else:
-                print(par[2])
-                self.write('not valid\r\n')
+                log.debug('Invalid ratio %s', par[2])
+                self.send('not valid\r\n')
                 return
         if data.startswith("nphas 2"):
             par = data.split()
             if len(par) < 3:
-                print(len(par), par)
-                self.write('not valid\r\n')
+                log.debug('Too few parameters: %s', par)
+                self.send('not valid\r\n')
                 return
 
             ph = float(par[2])
             if ph < 0 or ph > 360.:
-                self.write('not valid\r\n')
+                self.send('not valid\r\n')
                 return
-            self.oldphase = self.targetphase
-            self.targetphase = ph
-            self.phasechange = time.time()
-            self.write('valid\r\n')
+            self.chopper.setphase(ph)
+            self.send('valid\r\n')
 
     def rawDataReceived(self, data):
-        print "rawDataReceived:", data
+        log.debug("rawDataReceived: %s", data)
 
     def connectionMade(self):
-        print "connectionMade"
+        log.debug("connectionMade")
+
+    def connectionLost(self, reason):
+        if self.call is not None and self.call.active():
+            self.call.cancel()
+        self.call = None
+        self.queue.clear()
+
+class ChopperFactory(protocol.ServerFactory):
+    """
+    Serves the one chopper to all connections
+    """
+    def __init__(self, clock=reactor):
+        self.chopper = Chopper(clock)
+
+    def buildProtocol(self, addr):
+        p = Astrium_Chopper(self.chopper)
+        p.factory = self
+        return p
 
 def main():
-    factory = protocol.ServerFactory()
-    factory.protocol = Astrium_Chopper
+    factory = ChopperFactory()
     reactor.listenTCP(60000, factory)
     reactor.run()
 
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# vim: ts=8 sts=4 sw=4 expandtab
+#
+# Checks that the SINQ chopper simulator answers in the order of the
+# requests: sends asyst 1 immediately followed by nspee 1 <speed> and
+# expects the three status lines before the valid of nspee. Run it
+# against a running SIM_SINQ.py (or a simhost serving a sinqchopper).
+#
+import getopt
+import socket
+import sys
+
+expected = ['asyst 1', 'chopp_1', 'chopp_2', 'valid']
+
+def usage():
+    print ""
+    print "Usage:"
+    print "\tpython", sys.argv[0], "[-h -n <rounds>] [<host> [<port>]]"
+    print ""
+    print "-h: this help"
+    print "-n: number of rounds (default 10)"
+    print ""
+
+def readLines(sock, buf, count):
+    lines = []
+    while len(lines) < count:
+        while '\r\n' not in buf:
+            data = sock.recv(4096)
+            if not data:
+                raise IOError("connection closed")
+            buf += data
+        line, buf = buf.split('\r\n', 1)
+        lines.append(line)
+    return lines, buf
+
+def check(host, port, rounds):
+    sock = socket.create_connection((host, port), 5.)
+    buf = ''
+    failed = 0
+    for i in range(rounds):
+        sock.sendall('asyst 1\r\nnspee 1 %d\r\n' % (100 + i))
+        lines, buf = readLines(sock, buf, len(expected))
+        if not all(l.startswith(e) for l, e in zip(lines, expected)):
+            failed += 1
+            print "round", i, "out of order:", [l[:20] for l in lines]
+    sock.close()
+    return failed
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv[1:], "hn:", ["help", "rounds="])
+    except getopt.GetoptError as err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    rounds = 10
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit()
+        if o in ("-n", "--rounds"):
+            rounds = int(a)
+
+    host = 'localhost'
+    port = 60000
+    if len(args) > 0:
+        host = args[0]
+    if len(args) > 1:
+        port = int(args[1])
+
+    failed = check(host, port, rounds)
+    print failed, "of", rounds, "rounds out of order"
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -2,41 +2,37 @@
 # 
 # fake SINQ EL734 controller
 #
-# There are some interesting features here:
-#
-#  The initialisation via the global variable is a hack. It is necessary 
-#  because twisted makes a complete new EL734controller object per 
-#  connection. This also means that I cannot simulate errors by sending 
-#  a code from another connection.  
+# The motors belong to the factory: they are built and initialised once
+# and every connection talks to the same motors. Positions survive
+# reconnections and errors can be simulated by sending a code from
+# another connection. Only the remote/echo state is per connection.
 #
 # Mark Koennecke, June 2015
 #----------------------------------------------------------------------
 from twisted.internet import reactor, protocol
 from twisted.protocols.basic import LineReceiver
 import time
-from el734motor import EL734Motor
+import os
 import sys
+sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(__file__),"../util"))))
+from simlog import getLogger
+from el734motor import EL734Motor
 
-initFile = None
+log = getLogger("el734")
 
 class EL734Controller(LineReceiver):
-    def __init__(self):
+    def __init__(self, motors):
         self.remotestate = 0
         self.delimiter = '\r'
-        self.motors = {}
-        for i in range(1,13):
-            no = "%d" % i
-            self.motors[no] = EL734Motor()
-        if initFile != None:
-            self.loadConfig(initFile)
+        self.motors = motors
 
     def write(self, data):
-        print "transmitted:", data
+        log.debug("transmitted: %s", data)
         if self.transport is not None: 
             self.transport.write(data)
 
     def lineReceived(self, data):
-        print "lineReceived:", data
+        log.debug("lineReceived: %s", data)
         data = data.lower().strip()
 
         if self.remotestate == 0:
@@ -75,7 +71,7 @@ class EL734Controller(LineReceiver):
                return
 
            if data.startswith('h'):
-               print('Processing limits')
+               log.debug('Processing limits')
                if len(tlist) > 2:
                    txt = self.motors[tlist[1]].setlimits(float(tlist[2]),float(tlist[3]))
                    self.write('\r')
@@ -93,29 +89,44 @@ class EL734Controller(LineReceiver):
            self.write(txt + '\r')
            return
 
+
+class EL734Factory(protocol.ServerFactory):
+    protocol = EL734Controller
+
+    def __init__(self, initFile=None):
+        self.motors = {}
+        for i in range(1,13):
+            no = "%d" % i
+            self.motors[no] = EL734Motor()
+        if initFile != None:
+            self.loadConfig(initFile)
+
+    def buildProtocol(self, addr):
+        p = self.protocol(self.motors)
+        p.factory = self
+        return p
+
     def loadConfig(self,filename):
-        self.remotestate = 2
+        controller = self.buildProtocol(None)
+        controller.remotestate = 2
         inf = open(filename,'r')
         for line in inf:
-            print(line)
-            self.lineReceived(line)
+            log.debug('%s', line)
+            controller.lineReceived(line)
         inf.close()
-        self.remotestate = 0
-         
+
 
 def main(argv):
-    global initFile
     if len(argv) > 1:
         port = int(argv[1])
     else:
         port = 61000
 
+    initFile = None
     if len(argv) > 2:
         initFile = argv[2]
 
-    factory = protocol.ServerFactory()
-    factory.protocol = EL734Controller
-    reactor.listenTCP(port, factory)
+    reactor.listenTCP(port, EL734Factory(initFile))
     reactor.run()
 
 if __name__ == "__main__":
@@ -1,38 +1,53 @@
 #--------------------------------------------------------------
-# Fake EL734 motor. I do not bother with acceleration and 
-# deacceleration, just run linearly. All the parameters I 
-# ignore are held in a dictionary
+# Fake EL734 motor. Moves follow a trapezoidal velocity profile
+# made from the parameters: start/stop speed g, ramp e (kHz/s)
+# and top speed j. The position is computed from the profile
+# when it is asked for and the end of a move is a reactor timer,
+# so polling a motor costs next to nothing. The motion state of
+# all motors is held in a shared MotorBank, all the parameters I
+# ignore in a dictionary
 #
 # Mark Koennecke, June 2015
 #-------------------------------------------------------------
-import time
-import math
+import os
+import sys
+from twisted.internet import reactor
+sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(__file__),"../util"))))
+from simlog import getLogger
+from trapezoid import trapezoid, halt
+from motorbank import sharedBank
+
+# msr bits, the flags other than MSR_RUN are cleared by reading msr
+MSR_RUN = 0x1
+MSR_OK = 0x2
+MSR_STOP = 0x8
+MSR_LOWLIM = 0x10
+MSR_HIGHLIM = 0x20
+MSR_RUNFAIL = 0x80
+MSR_POSFAIL = 0x200
+MSR_ACFAIL = 0x1000
+# ss has the stop and limit bits of msr, one place lower
+SS_MASK = MSR_STOP | MSR_LOWLIM | MSR_HIGHLIM
 
 class EL734Motor(object):
     """
-    PSI EL734 fake motor 
+    PSI EL734 fake motor
     """
-    def __init__(self):
-        self.currentstep = 0
-        self.startstep = 0
+    def __init__(self,bank=None,clock=reactor):
+        if bank is None:
+            bank = sharedBank(clock)
+        self.log = getLogger("el734.motor")
+        self.bank = bank
+        self.clock = bank.clock
+        self.axis = bank.add()
         self.gear = 1000
         self.speed = 100
-        self.targetstep = 0
-        self.starttime = time.time()
-        self.moving = False
-        self.stop = False
-        self.sign = 1;
         self.lowlim = -180.
-        self.hitlow = False
         self.highlim = 360.
-        self.hithigh = False
         self.refrun = False
         self.reftarget = self.highlim * self.gear
-        self.target = .0
-        self.stopping = False
-        self.acfail = False
-        self.runfail = False
-        self.posfail = False
+        self.target = None
+        self.limit = 0
         self.par = {"a" : "3", "ec" : "1 2", "ep" : "1", "fd": "500 1", \
                         "d" : "0.1", "e" : "20", "f" : "1", "g" : "300", \
                         "k" :"1", "l" : "0", "m" : "3", "q" : "0.0", \
@@ -40,9 +55,8 @@ class EL734Motor(object):
 
     def setpar(self,key,val):
         if self.refrun:
-            self.iterate()
             return '*BSY'
-        if key in self.par.keys():
+        if key in self.par:
             self.par[key] = val
             return ""
         else:
@@ -55,7 +69,7 @@ class EL734Motor(object):
                 return ""
             elif key == "u":
                 pos = float(val)
-                self.currentstep = pos*self.gear
+                self.bank.setPosition(self.axis,pos*self.gear)
                 return ""
             elif key == "p":
                 self.startdrive(float(val))
@@ -64,20 +78,18 @@ class EL734Motor(object):
                 self.reftarget = int(val)
                 return ""
             elif key == "r":
-                self.refrun()
+                self.referenceRun()
                 return ""
             elif key == 's':
-                self.stop = True
-                self.iterate()
+                self.halt()
                 return ""
             else:
                 return "?CMD"
 
     def getpar(self,key):
         if self.refrun:
-            self.iterate()
             return "*BSY"
-        if key in self.par.keys():
+        if key in self.par:
             return self.par[key]
         else:
             if key == "j":
@@ -93,17 +105,16 @@ class EL734Motor(object):
             elif key == "v":
                 return "%d" % self.reftarget
             elif key == 's':
-                self.stop = True
-                self.iterate()
+                self.halt()
                 return ""
             elif key == 'xa':
-                self.acfail = True
+                self.fail(MSR_ACFAIL)
                 return ""
             elif key == 'xp':
-                self.posfail = True
+                self.bank.flags[self.axis] |= MSR_POSFAIL
                 return ""
             elif key == 'xr':
-                self.runfail = True
+                self.fail(MSR_RUNFAIL)
                 return ""
             else :
                 return "?CMD"
@@ -120,153 +131,79 @@ class EL734Motor(object):
             return "*BSY"
         return (self.lowlim,self.highlim)
 
-    def iterate(self):
-        if self.moving:
-            tdiff = time.time() - self.starttime
-            stepsDone = tdiff * self.speed
-            print('tdiff, stepsDone, startstep, targetstep, starttime: ' + str(tdiff) + ', ' + str(stepsDone) + ', ' +
-                 str(self.startstep) + ', ' + str(self.targetstep) + ', ' + str(self.starttime) )
-            if self.sign == 1:
-                # moving positive
-                curpos = self.startstep + stepsDone
-                if curpos >= self.targetstep:
-                    self.moving = False
-                    self.refrun = False
-                    if self.target  > self.highlim:
-                        self.currentstep = self.highlim * self.gear - 10
-                        self.hithigh = True
-                    else:
-                        self.currentstep = self.target*self.gear
+    def moving(self):
+        return bool(self.bank.moving[self.axis])
 
-                    self.stopping = True
-                else:
-                    self.currentstep = self.startstep + stepsDone
-                    if self.runfail or self.acfail:
-                        self.moving = False
-                        self.stopping = True
-            else:
-                # moving negative
-                curpos = self.startstep - stepsDone 
-                if curpos <= self.targetstep:
-                    self.moving = False
-                    self.refrun = False
-                    if self.target < self.lowlim:
-                        self.currentstep = self.lowlim*self.gear + 10
-                        self.hitlow = True
-                    else :
-                        self.currentstep = self.target*self.gear
-                    self.stopping = True
-                else:
-                    self.currentstep = self.startstep - stepsDone
-                    if self.runfail or self.acfail:
-                        self.moving = False
-                        self.stopping = True
-                    
-            if self.stop:
-                self.moving = False
-                self.refrun = False
-            
+    def ramp(self):
+        """Start/stop speed and acceleration in steps/s and steps/s^2"""
+        try:
+            return float(self.par["g"]),float(self.par["e"])*1000.
+        except ValueError:
+            return 0.,0.
+
+    def move(self,profile):
+        self.bank.move(self.axis,profile,self.finished)
+
+    def finished(self):
+        """The end of the move, as scheduled on the reactor"""
+        self.refrun = False
+        if self.limit:
+            self.bank.flags[self.axis] |= self.limit
+        elif self.target is not None:
+            self.bank.flags[self.axis] |= MSR_OK
+        self.log.debug('move ended at step %s, msr flags %x',
+                  self.bank.current[self.axis], self.bank.flags[self.axis])
 
     def readpos(self):
-        self.iterate()
-        pos = self.currentstep/self.gear
-        return "%6.3f" % (pos)
+        return "%6.3f" % (self.bank.position(self.axis)/self.gear)
 
     def startdrive(self,target):
-        self.startstep = self.currentstep
-        self.starttime = time.time()
-        self.targetstep = target*self.gear
-        pos = self.currentstep/self.gear
-        if target < pos:
-            self.sign = -1
-        else:
-            self.sign = 1
-        self.hithigh = False
-        self.hitlow = False
-        self.moving = True
-        self.stop = False
-        self.refrun = False
+        now = self.clock.seconds()
+        currentstep = self.bank.position(self.axis,now)
+        # a move beyond a limit switch ends just inside it
+        self.limit = 0
+        endstep = target*self.gear
+        if target > self.highlim and endstep > currentstep:
+            endstep = self.highlim*self.gear - 10
+            self.limit = MSR_HIGHLIM
+        elif target < self.lowlim and endstep < currentstep:
+            endstep = self.lowlim*self.gear + 10
+            self.limit = MSR_LOWLIM
         self.target = target
-        self.stopping = False
-        self.acfail = False
-        self.posfail = False
-        self.runfail = False
+        self.bank.flags[self.axis] = 0
+        vstart,accel = self.ramp()
+        self.log.debug('move from step %s to %s', currentstep, endstep)
+        self.move(trapezoid(now,currentstep,endstep,self.speed,vstart,accel))
+
+    def halt(self):
+        """The stop command: a moving motor ramps down and stops"""
+        if not self.bank.moving[self.axis]:
+            self.bank.flags[self.axis] |= MSR_STOP
+            return
+        vstart,accel = self.ramp()
+        self.limit = MSR_STOP
+        self.target = None
+        self.move(halt(self.bank.profile(self.axis),self.clock.seconds(),vstart,accel))
+
+    def fail(self,flag):
+        """A run or air cushion failure stops a moving motor at once"""
+        self.bank.flags[self.axis] |= flag
+        if self.bank.moving[self.axis]:
+            self.limit = 0
+            self.target = None
+            self.move(halt(self.bank.profile(self.axis),self.clock.seconds()))
 
     def calcmsr(self):
-        self.iterate()
-        if self.moving:
-            msr = '1'
-        else:
-            msr = '0'
-        if self.stopping and self.currentstep == self.targetstep:
-            msr += '1'
-            self.stopping = False
-        else:
-            msr += '0'
-        msr += '0'
-        if self.stop:
-            msr += '1'
-            self.stop = False
-        else:
-            msr += '0'
-        if self.hitlow:
-            msr += '1'
-            self.hitlow = False
-        else:
-            msr += '0'
-        if self.hithigh:
-            msr += '1'
-            self.hithigh = False
-        else:
-            msr += '0'
-        msr += '0'
-
-        if self.runfail:
-            msr += '1'
-            self.runfail = False
-        else:
-            msr += '0'
-        msr += '0'
-
-        if self.posfail:
-            msr += '1'
-            self.posfail = False
-        else:
-            msr += '0'
-        msr += '0'
-        msr += '0'
-        
-        if self.acfail:
-            msr += '1'
-            self.acfail = False
-        else:
-            msr += '0'
-            
-        msr += '0'
-
-        print('raw msr ' + msr[::-1])
-        return "%d" % int(msr[::-1],2)
+        msr = self.bank.flags[self.axis]
+        if self.bank.moving[self.axis]:
+            msr |= MSR_RUN
+        self.bank.flags[self.axis] = 0
+        return "%d" % msr
 
     def calcss(self):
-        self.iterate()
-        ss = '00'
-        if self.stop:
-            ss += '1'
-        else:
-            ss += '0'
-        if self.hitlow:
-            ss += '1'
-        else :
-            ss += '0'
-        if self.hithigh:
-            ss += '1'
-        else :
-            ss += '0'
-        ss += '0'
-        return "%d" % int(ss[::-1],2)
+        return "%d" % ((self.bank.flags[self.axis] & SS_MASK) >> 1)
 
-    def refrun(self):
-        self.startdrive(self.reftarget/self.gear)
+    def referenceRun(self):
+        # before the move, which ends at once when already at the target
         self.refrun = True
-
-
+        self.startdrive(self.reftarget/self.gear)
@@ -0,0 +1,82 @@
+from twisted.internet import defer, reactor
+from twisted.internet.threads import deferToThread
+
+class DatasetRegistry(object):
+    """Event arrays shared by all the controllers of a factory.
+
+    Datasets are keyed by (source, multiplier) and reference counted:
+    acquire() loads a dataset in a thread only if no controller holds
+    it yet (controllers asking while it loads wait for the same load).
+    When the last controller lets go the dataset is kept for grace
+    seconds more and evicted only if no controller acquired it again
+    meanwhile, so a client which disconnects and reconnects does not
+    load it anew.
+
+    Args:
+    load (callable): load(source, multiplier) returns the event array
+    grace (float): seconds an unused dataset is kept
+    """
+
+    def __init__(self,load,grace=60.,clock=reactor):
+        self.load = load
+        self.grace = grace
+        self.clock = clock
+        self.entries = {}
+
+    def acquire(self,source,multiplier):
+        """Returns a Deferred firing with the dataset. Every acquire()
+        must be matched by a release(), also when the Deferred fails.
+        """
+        key = (source,multiplier)
+        entry = self.entries.get(key)
+        if entry is None:
+            print "Loading",source,"x",multiplier
+            entry = self.entries[key] = {"refs":0,"data":None,"waiting":[],"evict":None}
+            d = deferToThread(self.load,source,multiplier)
+            d.addCallbacks(self.loaded,self.failed,callbackArgs=(key,entry),errbackArgs=(key,entry))
+        if entry["evict"] is not None:
+            entry["evict"].cancel()
+            entry["evict"] = None
+        entry["refs"] += 1
+
+        if entry["data"] is not None:
+            return defer.succeed(entry["data"])
+        d = defer.Deferred()
+        entry["waiting"].append(d)
+        return d
+
+    def release(self,source,multiplier):
+        key = (source,multiplier)
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        entry["refs"] -= 1
+        if entry["refs"] <= 0 and entry["evict"] is None:
+            entry["evict"] = self.clock.callLater(self.grace,self.evict,key,entry)
+
+    def evict(self,key,entry):
+        entry["evict"] = None
+        if self.entries.get(key) is entry and entry["refs"] <= 0:
+            print "Evicting",key[0],"x",key[1]
+            del self.entries[key]
+
+    def loaded(self,data,key,entry):
+        if self.entries.get(key) is not entry:
+            return
+        entry["data"] = data
+        waiting,entry["waiting"] = entry["waiting"],[]
+        for d in waiting:
+            d.callback(data)
+
+    def failed(self,failure,key,entry):
+        if self.entries.get(key) is entry:
+            del self.entries[key]
+        if entry["evict"] is not None:
+            entry["evict"].cancel()
+            entry["evict"] = None
+        waiting,entry["waiting"] = entry["waiting"],[]
+        for d in waiting:
+            d.errback(failure)
+
+    def __len__(self):
+        return len(self.entries)
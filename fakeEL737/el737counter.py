@@ -2,7 +2,8 @@
 # 
 # fake SINQ EL737 counter box
 #
-# I am using 1000cts/sec for m1, 500 for m2, 300 for m3 and 2000 for m4
+# Counts are simulated by countModel.CountModel, Poisson with 1000cts/sec
+# for m1, 1500 for m2, 500 for m3, 300 for m4 and 2000 for m5
 #
 # Mark Koennecke, July 2015
 #
@@ -13,49 +14,28 @@
 from twisted.internet import reactor, protocol
 from twisted.protocols.basic import LineReceiver
 import time
+import os
 import sys
+sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(__file__),"../util"))))
+
+from countModel import CountModel
 
 class EL737Controller(LineReceiver):
     def __init__(self):
         self.remotestate = 0
         self.delimiter = '\r'
-        self.mode = 'timer'
-        self.preset = .0
-        self.starttime = time.time()
-        self.endtime = time.time()
-        self.counting = False
-        self.mypaused = False
-        self.nobeam = False
-        self.pausestart = 0
-        self.pausedTime = 0.
+        self.counts = CountModel()
         self.threshold = 0
         self.thresholdcounter = 1
 
+    def connectionLost(self, reason):
+        self.counts.stop()
+
     def write(self, data):
         print "transmitted:", data
         if self.transport is not None: 
             self.transport.write(data)
     
-    def calculateCountStatus(self):
-        if self.threshold == 500:
-            self.nobeam = True
-        else:
-            self.nobeam = False
-        if self.counting and not self.mypaused and not self.nobeam:
-            runtime = time.time() - self.starttime - self.pausedTime
-            print(str(runtime) + ' versus ' + str(self.preset))
-            if self.mode == 'timer':
-                if runtime >= self.preset:
-                    self.counting = False
-                    self.endtime = self.starttime + self.preset
-                    self.pausedTime = 0
-            else:
-                if runtime*1000 >= self.preset:
-                    self.counting = False
-                    self.endtime = self.starttime + self.preset/1000
-        print('count flag after calculateCountStatus ' + str(self.counting))
-
-
     def lineReceived(self, data):
         print "lineReceived:", data
         data = data.lower().strip()
@@ -84,56 +64,36 @@ class EL737Controller(LineReceiver):
 
            if data.startswith('mp'):
                l = data.split()
-               self.mode = 'monitor'
-               self.preset = float(l[1])
-               self.starttime = time.time()
-               self.mypaused = False
-               self.pausedTime = 0.
-               self.counting = True
+               self.counts.start('monitor',float(l[1]))
                self.write('\r')
                return
                
            if data.startswith('tp'):
                l = data.split()
-               self.mode = 'timer'
-               self.preset = float(l[1])
-               self.starttime = time.time()
-               self.mypaused = False
-               self.pausedTime = 0.
-               self.counting = True
+               self.counts.start('timer',float(l[1]))
                self.write('\r')
                return
                
            if data.startswith('s'):
-               self.counting = False
-               self.endtime = time.time()
+               self.counts.stop()
                self.write('\r')
                return
 
            if data.startswith('ps'):
-               self.counting = True
-               self.mypaused = True
-               self.pausestart = time.time()
+               self.counts.pause()
                self.write('\r')
                return
 
            if data.startswith('co'):
-               if not self.mypaused:
-                   pass
-               else:
-                   self.mypaused = False
-                   self.pausedTime  += time.time() - self.pausestart
+               self.counts.resume()
                self.write('\r')
                return
 
            if data.startswith('dl'):
                l = data.split()
                if len(l) >= 3:
-                   if self.threshold == 500 and float(l[2]) != 500:
-                       self.pausedTime += time.time() - self.pausestart
                    self.threshold = float(l[2])
-                   if self.threshold == 500:
-                       self.pausestart = time.time()
+                   self.counts.setBeam(self.threshold != 500)
                    self.write('\r')
                else:
                    self.write(str(self.threshold) + '\r')
@@ -148,20 +108,19 @@ class EL737Controller(LineReceiver):
                    self.write(str(self.thresholdcounter) + '\r')
 
            if data.startswith('rs'):
-               self.calculateCountStatus()
-               if self.counting:
-                   if self.mypaused:
-                       if self.mode == 'timer':
+               if self.counts.counting:
+                   if self.counts.paused:
+                       if self.counts.mode == 'timer':
                            self.write('9\r')
                        else:
                            self.write('10\r')
-                   elif self.nobeam:
-                       if self.mode == 'timer':
+                   elif self.counts.nobeam:
+                       if self.counts.mode == 'timer':
                            self.write('5\r')
                        else:
                            self.write('6\r')
                    else:
-                       if self.mode == 'timer':
+                       if self.counts.mode == 'timer':
                            self.write('1\r')
                        else:
                            self.write('2\r')
@@ -169,26 +128,22 @@ class EL737Controller(LineReceiver):
                    self.write('0\r')
                return
 
-           if data.startswith('ra'):
-               self.calculateCountStatus()
-               if self.counting:
-                   if self.mypaused or self.nobeam:
-                       pausetime = time.time() - self.pausestart
-                   else:
-                       pausetime = self.pausedTime
-                   diff = time.time() - self.starttime - pausetime
+           if data.startswith('rate'):
+               l = data.split()
+               if len(l) > 1:
+                   rates = [float(r) for r in l[1:]]
+                   self.counts.setRates((rates+[0.]*8)[:8])
+                   self.write('\r')
                else:
-                   diff = self.endtime - self.starttime
+                   self.write(' '.join([str(r) for r in self.counts.rates]) + '\r')
+               return
+
+           if data.startswith('ra'):
+               diff, counts = self.counts.read()
                rlist = []
                rlist.append(str(diff))
-               rlist.append(str(int(diff*1000)))
-               rlist.append(str(int(diff*1500)))
-               rlist.append(str(int(diff*500)))
-               rlist.append(str(int(diff*300)))
-               rlist.append(str(int(diff*2000)))
-               rlist.append('0')
-               rlist.append('0')
-               rlist.append('0')
+               for c in counts:
+                   rlist.append(str(c))
                rastring = ' '.join(rlist)
                self.write(rastring +'\r')
                return
@@ -2,32 +2,29 @@
 # 
 # fake SINQ EL737 counter box
 #
-# I am using 1000cts/sec for m1, 500 for m2, 300 for m3 and 2000 for m4
+# Counts are simulated by countModel.CountModel: m1 counts the streamed
+# events, the other counters are Poisson with 1500, 500, 300 and 2000 cts/sec
 #
 # Mark Koennecke, July 2015
 #----------------------------------------------------------------------
-from twisted.internet import reactor, protocol
+from twisted.internet import reactor, protocol, task
 from twisted.protocols.basic import LineReceiver
 import time
+import os
 import sys
+sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(__file__),"../util"))))
 
 import zmq
 from nexus2event import *
 from neventarray import *
-import threading
+from datasetRegistry import DatasetRegistry
+from countModel import CountModel
 
 class EL737Controller(LineReceiver):
     def __init__(self):
         self.remotestate = 0
         self.delimiter = '\r'
-        self.mode = 'timer'
-        self.preset = .0
-        self.starttime = time.time()
-        self.endtime = time.time()
-        self.counting = False
-        self.mypaused = False
-        self.pausestart = 0
-        self.pausedTime = 0.
+        self.counts = CountModel()
         self.threshold = 0
         self.thresholdcounter = 1
 
@@ -35,30 +32,27 @@ class EL737Controller(LineReceiver):
         self.socket = []
         self.source = []
         self.multiplier = 1
-        self.Stop = False
+        self.data = None
+        self.dataset = None
+        self.loop = None
         self.dtype = event_t
 
+    def connectionLost(self, reason):
+        self.counts.stop()
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+        if self.socket:
+            self.socket.close(linger=0)
+        if self.dataset is not None:
+            self.factory.datasets.release(*self.dataset)
+            self.dataset = None
+        self.data = None
+
     def write(self, data):
         print "transmitted:", data
         if self.transport is not None: 
             self.transport.write(data)
     
-    def calculateCountStatus(self):
-        if self.counting and not self.mypaused :
-            runtime = time.time() - self.starttime - self.pausedTime
-            print(str(runtime) + ' versus ' + str(self.preset))
-            if self.mode == 'timer':
-                if runtime >= self.preset:
-                    self.counting = False
-                    self.endtime = self.starttime + self.preset
-                    self.pausedTime = 0
-            else:
-                if runtime*1000 >= self.preset:
-                    self.counting = False
-                    self.endtime = self.starttime + self.preset/1000
-        print('count flag after calculateCountStatus ' + str(self.counting))
-
-
     def lineReceived(self, data):
         print "lineReceived:", data
 
@@ -81,6 +75,7 @@ class EL737Controller(LineReceiver):
                 """
                 self.socket = self.context.socket(zmq.PUSH)
                 self.socket.bind("tcp://127.0.0.1:"+data.split(" ")[2])
+                self.socket.setsockopt(zmq.SNDHWM, 100)
                 self.write("zmq connected on port "+data.split(" ")[2])
                 self.write("\r")
                 self.source = data.split(" ")[1]
@@ -118,9 +113,7 @@ class EL737Controller(LineReceiver):
 
                     """
                     self.remotestate = 2
-                    thread = threading.Thread(target=self.start)
-                    thread.daemon = True
-                    thread.start()
+                    self.start()
                 else:
                     self.write("?loc\r")
             return
@@ -134,45 +127,28 @@ class EL737Controller(LineReceiver):
 
            if data.startswith('mp'):
                l = data.split()
-               self.mode = 'monitor'
-               self.preset = float(l[1])
-               self.starttime = time.time()
-               self.mypaused = False
-               self.pausedTime = 0.
-               self.counting = True
+               self.counts.start('monitor',float(l[1]))
                self.write('\r')
                return
                
            if data.startswith('tp'):
                l = data.split()
-               self.mode = 'timer'
-               self.preset = float(l[1])
-               self.starttime = time.time()
-               self.mypaused = False
-               self.pausedTime = 0.
-               self.counting = True
+               self.counts.start('timer',float(l[1]))
                self.write('\r')
                return
                
            if data.startswith('s'):
-               self.counting = False
-               self.endtime = time.time()
+               self.counts.stop()
                self.write('\r')
                return
 
            if data.startswith('ps'):
-               self.counting = True
-               self.mypaused = True
-               self.pausestart = time.time()
+               self.counts.pause()
                self.write('\r')
                return
 
            if data.startswith('co'):
-               if not self.mypaused:
-                   pass
-               else:
-                   self.mypaused = False
-                   self.pausedTime  += time.time() - self.pausestart
+               self.counts.resume()
                self.write('\r')
                return
 
@@ -193,15 +169,14 @@ class EL737Controller(LineReceiver):
                    self.write(str(self.thresholdcounter) + '\r')
 
            if data.startswith('rs'):
-               self.calculateCountStatus()
-               if self.counting:
-                   if self.mypaused:
-                       if self.mode == 'timer':
+               if self.counts.counting:
+                   if self.counts.paused:
+                       if self.counts.mode == 'timer':
                            self.write('9\r')
                        else:
                            self.write('10\r')
                    else:
-                       if self.mode == 'timer':
+                       if self.counts.mode == 'timer':
                            self.write('1\r')
                        else:
                            self.write('2\r')
@@ -209,26 +184,22 @@ class EL737Controller(LineReceiver):
                    self.write('0\r')
                return
 
-           if data.startswith('ra'):
-               self.calculateCountStatus()
-               if self.counting:
-                   if self.mypaused:
-                       pausetime = time.time() - self.pausestart
-                   else:
-                       pausetime = self.pausedTime
-                   diff = time.time() - self.starttime - pausetime
+           if data.startswith('rate'):
+               l = data.split()
+               if len(l) > 1:
+                   rates = [float(r) for r in l[1:]]
+                   self.counts.setRates((rates+[0.]*8)[:8])
+                   self.write('\r')
                else:
-                   diff = self.endtime - self.starttime
+                   self.write(' '.join([str(r) for r in self.counts.rates]) + '\r')
+               return
+
+           if data.startswith('ra'):
+               diff, counts = self.counts.read()
                rlist = []
                rlist.append(str(diff))
-               rlist.append(str(int(diff*1000)))
-               rlist.append(str(int(diff*1500)))
-               rlist.append(str(int(diff*500)))
-               rlist.append(str(int(diff*300)))
-               rlist.append(str(int(diff*2000)))
-               rlist.append('0')
-               rlist.append('0')
-               rlist.append('0')
+               for c in counts:
+                   rlist.append(str(c))
                rastring = ' '.join(rlist)
                self.write(rastring +'\r')
                return
@@ -241,46 +212,76 @@ class EL737Controller(LineReceiver):
 
 
     def start(self):
+        """Gets the data from the datasets of the factory, loaded in a
+        thread unless another connection holds it already, then sends a
+        pulse every 1/14 s from the reactor. Pulses that find the socket at
+        its SNDHWM are dropped instead of blocking the reactor.
+        """
+        if self.loop is not None:
+            print "Nothing to do, generator already started"
+            return
         print "generator started"
-        data = loadNeXus2event(self.source)
-
-        if self.multiplier > 1:
-            data = multiplyNEventArray(data,int(self.multiplier))
-
-        ctime=time.time()
-        pulseID=0
-        count = 0
-        
-        while not self.Stop:
-            itime = time.time()
-            dataHeader=header(pulseID,itime)
-            
-            def send_data(data,socket,head):
-                socket.send_json(head,zmq.SNDMORE)
-                socket.send(data)
+        self.loop = task.LoopingCall.withCount(self.sendPulse)
+        self.dataset = (self.source,self.multiplier)
+        d = self.factory.datasets.acquire(*self.dataset)
+        d.addCallback(self.loaded)
+        d.addErrback(self.failed)
+
+    def loaded(self, data):
+        if self.dataset is None:
+            return
+        self.data = data
+        self.counts.stream()
+        self.pulseID = -1
+        self.count = 0
+        self.dropped = 0
+        self.ctime = time.time()
+        self.loop.start(1./14)
 
-            if self.mypaused == False:
-                send_data(data,self.socket,dataHeader)
-                count += 1
+    def failed(self, failure):
+        print "Unable to load",self.source,":",failure.getErrorMessage()
+        self.loop = None
+        if self.dataset is not None:
+            self.factory.datasets.release(*self.dataset)
+            self.dataset = None
 
-            elapsed = time.time() - itime
-            remaining = 1./14-elapsed
+    def sendPulse(self, elapsed):
+        # LoopingCall skips the calls it missed, keep the pulse ID in step
+        self.pulseID += elapsed
 
-            if remaining > 0:
-                time.sleep (remaining)
+        if not self.counts.paused:
+            try:
+                self.socket.send_json(header(self.pulseID,time.time()),zmq.SNDMORE|zmq.NOBLOCK)
+                self.socket.send(self.data)
+                self.counts.addEvents(self.data.size)
+                self.count += 1
+            except zmq.Again:
+                self.dropped += 1
 
-            pulseID += 1
+        if time.time()-self.ctime > 10 :
+            size = self.data.size*self.dtype.itemsize
 
-            if time.time()-ctime > 10 :
-                size = (data.size*self.dtype.itemsize+
-                        sys.getsizeof(dataHeader))
+            print "Sent ",self.count," events @ ",size*self.count/(10.*1e6)," MB/s, dropped at HWM ",self.dropped
+            self.count = 0
+            self.dropped = 0
+            self.ctime = time.time()
 
-                print "Sent ",count," events @ ",size*count/(10.*1e6)," MB/s"
-                count = 0
-                ctime = time.time()
 
 
 
+class EL737Factory(protocol.ServerFactory):
+    protocol = EL737Controller
+
+    def __init__(self):
+        self.datasets = DatasetRegistry(load)
+
+
+def load(source, multiplier):
+    data = loadNeXus2event(source)
+    if multiplier > 1:
+        data = multiplyNEventArray(data,int(multiplier))
+    return data
+
 
 def main(argv):
     if len(argv) > 1:
@@ -288,9 +289,7 @@ def main(argv):
     else:
         port = 62001
 
-    factory = protocol.ServerFactory()
-    factory.protocol = EL737Controller
-    reactor.listenTCP(port, factory)
+    reactor.listenTCP(port, EL737Factory())
     reactor.run()
 
 if __name__ == "__main__":
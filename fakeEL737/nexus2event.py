@@ -8,12 +8,26 @@ import nxs
 import neventarray
 
 
+def expandHistogram(data):
+    """Returns, for each axis of the histogram, the bin index of every
+    counted event. Events come out in C order of data, the same order a
+    nested loop over all bins would produce them in.
+    """
+    data = np.asarray(data)
+    nonzero = np.flatnonzero(data > 0)
+    counts = data.ravel()[nonzero]
+    return [np.repeat(i, counts) for i in np.unravel_index(nonzero, data.shape)]
+
+
+def tofBins(tof):
+    """Per-bin event timestamps, rounded the same way as a Python loop would."""
+    return np.array([round(t/10.) for t in tof], dtype=np.uint32)
+
+
 def loadAMOR(source) :
     f = nxs.open(source,'r')
 
     f.openpath("entry1/AMOR/area_detector/data")
-    dim,datatype= f.getinfo()
-    size = np.prod(dim)
     data = f.getdata()
     f.close()
 
@@ -22,28 +36,18 @@ def loadAMOR(source) :
     tof = f.getdata()
     f.close()
 
-    nEvents = np.sum(data)
-    signal = np.empty(nEvents,dtype=neventarray.event_t)
+    return expandAMOR(data,tof)
 
-    nEv = 0
-    detID = 0
-    for row in range(dim[0]):
-        for col in range(dim[1]):
-            for it in range(dim[2]):
-                events = data[row][col][it]
-                if events > 0:
-                    signal[nEv:nEv+events]["ts"] = round(tof[it]/10.)
-                    signal[nEv:nEv+events]["x"] = row
-                    signal[nEv:nEv+events]["y"] = col
-                    nEv = nEv+events
-
-    if not signal.shape[0] == nEv:
-        raise Exception("Error in reading NeXus data: wrong number of events",nEv)
-
-    return signal
 
+def expandAMOR(data,tof):
+    row, col, it = expandHistogram(data)
 
+    signal = np.zeros(row.size,dtype=neventarray.event_t)
+    signal["ts"] = tofBins(tof)[it]
+    signal["x"] = row
+    signal["y"] = col
 
+    return signal
 
 
 
@@ -52,31 +56,18 @@ def loadFOCUS(source) :
     f = nxs.open(source,'r')
 
     f.openpath("entry1/FOCUS/merged/counts")
-    dim,datatype= f.getinfo()
-    size = np.prod(dim)
     data = f.getdata()
     f.close()
 
-    f = nxs.open(source,'r')
-    f.openpath("entry1/FOCUS/merged/time_binning")
-    tof = f.getdata()
-    f.close()
+    return expandFOCUS(data)
 
-    nEvents = np.sum(data)
-    signal = np.empty(nEvents,dtype=neventarray.event_t)
 
-    nEv = 0
-    detID = 0
-    for row in range(dim[0]):
-        for it in range(dim[1]):
-            events = data[row][it]
-            if events > 0:
-                signal[nEv:nEv+events]["x"] = row
-                signal[nEv:nEv+events]["y"] = it
-                nEv = nEv+events
+def expandFOCUS(data):
+    row, it = expandHistogram(data)
 
-    if not signal.shape[0] == nEv:
-        raise Exception("Error in reading NeXus data: wrong number of events",nEv)
+    signal = np.zeros(row.size,dtype=neventarray.event_t)
+    signal["x"] = row
+    signal["y"] = it
 
     return signal
 ##########################
@@ -87,33 +78,24 @@ def loadRITA2(source) :
     f = nxs.open(source,'r')
 
     f.openpath("entry1/RITA-2/detector/counts")
-    dim,datatype= f.getinfo()
-    size = np.prod(dim)
     data = f.getdata()
     f.close()
 
-    np.random.seed(1234)
-    timestamp = np.sort(np.random.randint(2**32-1,size=dim[0]))
+    return expandRITA2(data)
+
 
-    nEvents = np.sum(data)
-    signal = np.empty(nEvents,dtype=neventarray.event_t)
+def expandRITA2(data):
+    dim = np.shape(data)
 
-    nEv = 0
-    detID = 0
+    np.random.seed(1234)
+    timestamp = np.sort(np.random.randint(2**32-1,size=dim[0]))
 
-    row = np.uint16
-    col = np.uint16
+    row, col, it = expandHistogram(np.transpose(data,(1,2,0)))
 
-    for row in range(dim[1]):
-        for col in range(dim[2]):
-            for it in range(dim[0]):
-                events = data[it][row][col]
-                if events > 0:
-                    signal[nEv:nEv+events]["ts"] = timestamp[it]
-                    signal[nEv:nEv+events]["sync"] = 0 
-                    signal[nEv:nEv+events]["x"] = row
-                    signal[nEv:nEv+events]["y"] = col
-                    nEv = nEv+events
+    signal = np.zeros(row.size,dtype=neventarray.event_t)
+    signal["ts"] = timestamp[it]
+    signal["x"] = row
+    signal["y"] = col
 
     return signal
 
@@ -142,5 +124,7 @@ def loadNeXus2event(source):
         return loadAMOR(source)
     if "rita" in source:
         return loadRITA2(source)
+    if "focus" in source:
+        return loadFOCUS(source)
 
     raise NotImplementedError("Detector not implemented")
@@ -4,7 +4,7 @@
 #
 from twisted.internet import reactor, protocol
 from twisted.protocols.basic import LineReceiver
-from twisted.python import log
+from twisted.python import log as twistedLog
 from twisted.internet.task import LoopingCall
 
 import os
@@ -12,6 +12,9 @@ import sys
 import curses
 sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]),"../../util"))))
 from displayscreen import Screen
+from simlog import getLogger
+
+log = getLogger("nhq")
 
 devices = []
 
@@ -83,11 +86,11 @@ class NHQ_200(LineReceiver):
 
     def write(self, data):
         sent = data
-        print "transmitted:", repr(sent)
+        log.debug("transmitted: %r", sent)
         self.transport.write(sent)
 
     def lineReceived(self, data):
-        print "lineReceived:", data
+        log.debug("lineReceived: %s", data)
         if data == "#":
             self.write("123456;3.14;6000;1000uA");
             self.write(self.delimiter);
@@ -108,7 +111,7 @@ class NHQ_200(LineReceiver):
             self.write(result)
             self.write(self.delimiter);
             return
-        print "Unimplemented command for: '%s'" % data
+        log.warning("Unimplemented command for: '%s'", data)
         return
 
     def rawDataReceived(self, data):
@@ -121,11 +124,11 @@ class NHQ_200(LineReceiver):
             self.line = ""
 
     def connectionMade(self):
-        print "connectionMade"
+        log.info("connectionMade")
         devices.append(self)
 
     def connectionLost(self, reason):
-        print "connectionLost"
+        log.info("connectionLost")
         devices.remove(self)
 
 def device_iterator():
@@ -198,7 +201,7 @@ def main():
             help='Create a display window',\
             action='store_true', default=False)
     args = parser.parse_args()
-    log.startLogging(open(("/tmp/Fake_NHQ.log"), "w"))
+    twistedLog.startLogging(open(("/tmp/Fake_NHQ.log"), "w"))
     if args.verbose:
         print "Args:", args
         Verbose = True
@@ -4,59 +4,100 @@
 #
 # Any number of motors can be on a given controller channel. The Nanotecs 
 # sit on a RS-485 bus. Thus this requires an initalisation file containing 
-# the numbers of the motor and their min and maximum values. 
+# the numbers of the motor and their min and maximum values. The motors
+# are built once by the factory and shared by all connections.
+#
+# A command sent to the address * goes to all the motors, which answer
+# one after the other in the order of their numbers. With a baud rate
+# the replies are delayed like on the real bus: every command and reply
+# takes its time on the wire, every reply a turnaround time of the
+# motor, and the bus carries one at a time. Without, they come at once.
 #
 # Mark Koennecke, July 2015
 #----------------------------------------------------------------------
 from twisted.internet import reactor, protocol
 from twisted.protocols.basic import LineReceiver
-import time
-from nanotecmotor import NanotecMotor
+import getopt
+import os
+import re
 import sys
-import string
+sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(__file__),"../util"))))
+from simlog import getLogger
+from nanotecmotor import NanotecMotor
+
+log = getLogger("nanotec")
+
+# #<address><command><parameter>, the address is a motor number or *
+commandPattern = re.compile(r"#(\d+|\*)(.)(.*)$")
 
-initFile = None
+class RS485Bus(object):
+    """
+    Timing of the bus: baud None delivers the replies at once
+    """
+    def __init__(self,baud=None,turnaround=0.002,clock=reactor):
+        self.baud = baud
+        self.turnaround = turnaround
+        self.clock = clock
+        self.free = 0.
+
+    def deliver(self,write,command,replies):
+        """Writes the replies of the motors to command with write"""
+        data = ''.join(r + '\r' for r in replies)
+        if not self.baud:
+            write(data)
+            return
+        now = self.clock.seconds()
+        start = max(now,self.free)
+        # 10 bits per byte, the command went out with its CR
+        wire = (len(command) + 1 + len(data))*10./self.baud
+        self.free = start + wire + len(replies)*self.turnaround
+        self.clock.callLater(self.free - now,write,data)
 
 class NanotecController(LineReceiver):
-    def __init__(self):
+    def __init__(self, motors, bus):
         self.delimiter = '\r'
-        self.motors = {}
-        if initFile != None:
-            self.loadConfig(initFile)
+        self.motors = motors
+        self.bus = bus
 
     def write(self, data):
-        print "transmitted:", data
+        log.debug("transmitted: %s", data)
         if self.transport is not None: 
             self.transport.write(data)
 
-    def splitCommand(self,data):
-        idx = 1
-        motno = ''
-        while data[idx] in string.digits:
-            motno += data[idx]
-            idx = idx + 1
+    def lineReceived(self, data):
+        data = data.strip()
+        log.debug("lineReceived: %s", data)
+
+        match = commandPattern.match(data)
+        if match is None:
+            log.warning('Ignoring invalid line %s', data)
+            return
 
-        com = data[idx]
-        par = data[idx+1:]
-        print(par)
+        motno,com,par = match.groups()
         if len(par) <= 0:
             par = 'none'
-        print('Received motno, com, par ' + motno + ', ' + com + ', ' + par)
-        return motno,com,par
+        if motno == '*':
+            motors = self.factory.order
+        elif motno in self.motors:
+            motors = [self.motors[motno]]
+        else:
+            return
+        self.bus.deliver(self.write,data,[m.doCommand(com,par) for m in motors])
 
-    def lineReceived(self, data):
-        data = data.strip()
-        print "lineReceived:", data
 
-        if not data.startswith('#'):
-            print('Ignoring invalid line ' + data)
-            return
+class NanotecFactory(protocol.ServerFactory):
+    protocol = NanotecController
 
-        motno,com,par = self.splitCommand(data)
-        if motno in self.motors:
-            result = self.motors[motno].doCommand(com,par)
-            self.write(result + '\r')
+    def __init__(self, initFile, bus=None):
+        self.motors = {}
+        self.bus = bus or RS485Bus()
+        self.loadConfig(initFile)
+        self.order = [self.motors[m] for m in sorted(self.motors, key=int)]
 
+    def buildProtocol(self, addr):
+        p = self.protocol(self.motors, self.bus)
+        p.factory = self
+        return p
 
     def loadConfig(self,filename):
         inf = open(filename,'r')
@@ -67,23 +108,39 @@ class NanotecController(LineReceiver):
             if len(l) >= 3:
                 self.motors[l[0]] = NanotecMotor(l[0],l[1],l[2])
             else:
-                print('Mal formatted initialisation line ' + line)
+                log.warning('Mal formatted initialisation line %s', line)
         inf.close()
          
 
+def usage():
+    print('Usage\n\tnanotecController [-b baud] [-t turnaround] portno inifile\n')
+    print('-b: delay the replies like a RS-485 bus of this baud rate')
+    print('-t: turnaround time of a motor in ms with -b (default 2)\n')
+
 def main(argv):
-    global initFile
+    try:
+        opts,args = getopt.getopt(argv[1:], "b:t:", ["baud=","turnaround="])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        exit()
 
-    if len(argv) < 3:
-        print('Usage\n\tnanotecController portno inifile\n')
+    if len(args) < 2:
+        usage()
         exit()
 
-    port = int(argv[1])
-    initFile = argv[2]
+    baud = None
+    turnaround = 0.002
+    for o,a in opts:
+        if o in ("-b","--baud"):
+            baud = int(a)
+        if o in ("-t","--turnaround"):
+            turnaround = float(a)/1000.
+
+    port = int(args[0])
+    initFile = args[1]
 
-    factory = protocol.ServerFactory()
-    factory.protocol = NanotecController
-    reactor.listenTCP(port, factory)
+    reactor.listenTCP(port, NanotecFactory(initFile, RS485Bus(baud, turnaround)))
     reactor.run()
 
 if __name__ == "__main__":
@@ -1,57 +1,54 @@
 #--------------------------------------------------------------
 # Fake Nanotec SMCI motor. I do not bother with acceleration and
-# deacceleration, just run linearly. 
+# deacceleration, just run linearly. The position lives in the
+# MotorBank shared by all the motors of the process, which also
+# ends the moves, so a motor needs no iterating.
 #
 # The nanotecs have a huge command set. This implements only 
 # that part which is necessary to run the thing 
 #
 # Mark Koennecke, July 2015
 #-------------------------------------------------------------
-import time
-import math
+import os
+import sys
+from twisted.internet import reactor
+sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(__file__),"../util"))))
+from simlog import getLogger
+from trapezoid import trapezoid
+from motorbank import sharedBank
+
+# $ status words
+STATUS_READY = 161
+STATUS_MOVING = 160
+STATUS_REFERENCED = 163
+STATUS_LIMIT = 164
 
 class NanotecMotor(object):
     """
     Nanotec SMCI fake motor 
     """
-    def __init__(self,motno,minref,maxref):
+    def __init__(self,motno,minref,maxref,bank=None,clock=reactor):
+        if bank is None:
+            bank = sharedBank(clock)
+        self.log = getLogger("nanotec.motor")
+        self.bank = bank
+        self.axis = bank.add()
         self.speed = 1000
         self.motno = motno
         self.targetstep = 0
-        self.currentstep = 0
-        self.moving = False
-        self.starttime = 0
-        self.startstep  = 0
         self.mode =  'none'
-        self.sign = 1
         self.minref = float(minref)
         self.maxref = float(maxref)
         self.refdir = 0
         self.limitReported = False
 
-
-    def iterate(self):
-        if self.moving:
-            tdiff = time.time() - self.starttime
-            stepsDone = tdiff * self.speed
-            print('tdiff, stepsDone, startstep, targetstep, starttime: ' + str(tdiff) + ', ' + str(stepsDone) + ', ' +
-                 str(self.startstep) + ', ' + str(self.targetstep) + ', ' + str(self.starttime) )
-            if self.sign == 1:
-                # moving positive
-                curpos = self.startstep + stepsDone
-                if curpos >= self.targetstep:
-                    self.moving = False
-                    self.currentstep = self.targetstep
-                else:
-                    self.currentstep = self.startstep + stepsDone
-            else:
-                # moving negative
-                curpos = self.startstep - stepsDone 
-                if curpos <= self.targetstep:
-                    self.moving = False
-                    self.currentstep = self.targetstep
-                else:
-                    self.currentstep = self.startstep - stepsDone
+    def drive(self,target):
+        """Runs to target, or to the limit switch on the way to it"""
+        now = self.bank.clock.seconds()
+        start = self.bank.position(self.axis,now)
+        target = min(max(target,self.minref),self.maxref)
+        self.log.debug('move from step %s to %s', start, target)
+        self.bank.move(self.axis,trapezoid(now,start,target,self.speed))
 
     def makeReturn(self,com,val):
         if val != 'none':
@@ -64,8 +61,7 @@ class NanotecMotor(object):
     def doCommand(self,com, par):
         
         if com.startswith('C'):
-            self.iterate()
-            return self.makeReturn(com,self.currentstep)
+            return self.makeReturn(com,int(round(self.bank.position(self.axis))))
 
         if com.startswith('p'):
             val = int(par)
@@ -84,58 +80,45 @@ class NanotecMotor(object):
         
         if com.startswith('s'):
             self.targetstep = int(par)
-            if self.targetstep > self.currentstep:
-                self.sign = 1
-            else :
-                self.sign = -1
             return self.makeReturn(com,par)
 
         if com.startswith('A'):
-            self.startstep = self.currentstep
             self.limitReported = False
             if self.mode == 'abs':
-                self.starttime = time.time()
-                self.moving = True
+                self.drive(self.targetstep)
             elif self.mode == 'refrun':
                 if self.refdir == 0:
                     self.targetstep = self.minref
-                    self.sign = -1
                 else:
                     self.targetstep = self.maxref
-                    self.sign = 1
-                self.starttime = time.time()
-                self.moving = True
+                self.drive(self.targetstep)
             else:
                 pass
             return self.makeReturn(com,'none')
 
         if com.startswith('$'):
-            self.iterate()
-            if self.currentstep <= self.minref or self.currentstep >= self.maxref:
-                self.moving = False
+            step = self.bank.position(self.axis)
+            if step <= self.minref or step >= self.maxref:
+                self.bank.stop(self.axis)
                 if self.mode == 'refrun':
                     self.limitReported = True
-                    return self.makeReturn(com,163)
+                    return self.makeReturn(com,STATUS_REFERENCED)
                 if self.limitReported:
                     pass
                 else:
                     self.limitReported = True
-                    return self.makeReturn(com,164)
+                    return self.makeReturn(com,STATUS_LIMIT)
  
-            if self.moving:
-                mask = '0'
-            else:
-                mask = '1'
-            mask += '0'
-            mask += '000101'
-            return self.makeReturn(com,int(mask[::-1],2))
+            if self.bank.moving[self.axis]:
+                return self.makeReturn(com,STATUS_MOVING)
+            return self.makeReturn(com,STATUS_READY)
             
         if com.startswith('D'):
             if par == 'none':
                 val = 0
             else:
                 val = int(par)
-            self.currentstep = val
+            self.bank.setPosition(self.axis,val)
             return self.makeReturn(com,val)
 
         if com.startswith('d'):
@@ -144,8 +127,7 @@ class NanotecMotor(object):
             return self.makeReturn(com,par)
 
         if com.startswith('S'):
-            self.iterate()
-            self.moving = False
+            self.bank.stop(self.axis)
             return self.makeReturn(com,par)
 
         
@@ -11,7 +11,12 @@
 from twisted.internet import reactor, protocol
 from twisted.protocols.basic import LineReceiver
 import time
+import os
 import sys
+sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(__file__),"../util"))))
+from simlog import getLogger
+
+log = getLogger("sps")
 
 class SPSS5(LineReceiver):
     def __init__(self):
@@ -41,12 +46,12 @@ class SPSS5(LineReceiver):
         self.a8 = 8
         
     def write(self, data):
-        print "transmitted:", data
+        log.debug("transmitted: %s", data)
         if self.transport is not None: 
             self.transport.write(data+'\n')
     
     def lineReceived(self, data):
-        print "lineReceived:", data
+        log.debug("lineReceived: %s", data)
         data = data.lower().strip()
 
         if data.startswith('r'):
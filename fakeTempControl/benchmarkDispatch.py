@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# vim: ts=8 sts=4 sw=4 expandtab
+#
+# Micro-benchmark of the command dispatch of the Lakeshore and Mercury
+# devices: commands per second through the precompiled dispatch table,
+# against the exec based dispatch it replaced, and through the whole
+# dataReceived path, with the prints of the devices going to /dev/null.
+#
+import inspect
+import os
+import sys
+import time
+
+here = os.path.dirname(os.path.realpath(os.path.abspath(__file__)))
+for subdir in ("lakeshore", "oxford", "../util"):
+    sys.path.insert(0, os.path.realpath(os.path.join(here, subdir)))
+
+from Lakeshore336 import Lakeshore336
+from MercurySCPI import MercurySCPI
+
+class NullProtocol:
+    def write(self, data):
+        pass
+
+def execDispatch(device, methods, prefix, command, params):
+    method = "%s%s" % (prefix, command)
+    if method in methods:
+        action = "response = device.%s(command, params)" % method
+        exec action
+        return response
+    return False
+
+def tableDispatch(table, command, params):
+    method = table.get(command)
+    if method is not None:
+        return method(command, params)
+    return False
+
+def quiet(f):
+    """Runs f with the prints of the devices going to /dev/null"""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        return f()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def rate(f, count):
+    def loop():
+        start = time.time()
+        for i in xrange(count):
+            f()
+        return count / max(time.time() - start, 1e-9)
+    return quiet(loop)
+
+def benchmark(name, device, query, params, pdu, count):
+    methods = dict(inspect.getmembers(device, inspect.ismethod))
+    print name
+    print "  exec dispatch  %10.0f queries/s" % rate(
+        lambda: execDispatch(device, methods, "doQuery", query, params), count)
+    print "  table dispatch %10.0f queries/s" % rate(
+        lambda: tableDispatch(device.queries, query, params), count)
+    print "  dataReceived   %10.0f queries/s" % rate(
+        lambda: device.dataReceived(pdu), count)
+
+def main(argv):
+    count = 100000
+    if len(argv) > 1:
+        count = int(argv[1])
+    lakeshore = quiet(Lakeshore336)
+    mercury = quiet(MercurySCPI)
+    lakeshore.protocol = NullProtocol()
+    mercury.protocol = NullProtocol()
+    benchmark("Lakeshore336 KRDG? A", lakeshore, "KRDG", ["A"], "KRDG? A", count)
+    benchmark("MercurySCPI READ:DEV:DB7.T1:TEMP:SIG:TEMP", mercury, "READ",
+              ["DEV", "DB7.T1", "TEMP", "SIG", "TEMP"], "READ:DEV:DB7.T1:TEMP:SIG:TEMP", count)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -14,22 +14,22 @@ class Lakeshore340(LakeshoreDevice):
 
     def __init__(self):
         LakeshoreDevice.__init__(self)
-        print Lakeshore340.__name__, "ctor"
+        self.log.debug("%s ctor", Lakeshore340.__name__)
         self.CONFIG_LOOPS = [1, 2]
         self.CONFIG_SNSRS = [1, 2, 3, 4]
         self.CONFIG_RAMPS = [1, 2]
         self.reset_powerup()
 
     def doCommand(self, command, params):
-        print Lakeshore340.__name__, "Command:", command, params
+        self.log.debug("%s Command: %s %s", Lakeshore340.__name__, command, params)
         return LakeshoreDevice.doCommand(self, command, params)
 
     def doQuery(self, command, params):
-        print Lakeshore340.__name__, "Query:", command, params
+        self.log.debug("%s Query: %s %s", Lakeshore340.__name__, command, params)
         return LakeshoreDevice.doQuery(self, command, params)
 
     def reset_powerup(self):
-        print Lakeshore340.__name__, "reset_powerup"
+        self.log.debug("%s reset_powerup", Lakeshore340.__name__)
         self.LAST_ITERATION = 0
         self.ALARM = {}
         self.ALARMST = {}
@@ -14,22 +14,22 @@ class Lakeshore370(LakeshoreDevice):
 
     def __init__(self):
         LakeshoreDevice.__init__(self)
-        print Lakeshore370.__name__, "ctor"
+        self.log.debug("%s ctor", Lakeshore370.__name__)
         self.CONFIG_LOOPS = [1]
         self.CONFIG_SNSRS = [i for i in range(1,17)]
         self.CONFIG_RAMPS = [1]
         self.reset_powerup()
 
     def doCommand(self, command, params):
-        print Lakeshore370.__name__, "Command:", command, params
+        self.log.debug("%s Command: %s %s", Lakeshore370.__name__, command, params)
         return LakeshoreDevice.doCommand(self, command, params)
 
     def doQuery(self, command, params):
-        print Lakeshore370.__name__, "Query:", command, params
+        self.log.debug("%s Query: %s %s", Lakeshore370.__name__, command, params)
         return LakeshoreDevice.doQuery(self, command, params)
 
     def reset_powerup(self):
-        print Lakeshore370.__name__, "reset_powerup"
+        self.log.debug("%s reset_powerup", Lakeshore370.__name__)
         self.LAST_ITERATION = 0
         self.ALARM = {1: "0,1,500.0,0.0,0,0"}
         self.ALARMST = {1: "0,0"}
@@ -1,65 +1,76 @@
 # vim: ts=8 sts=4 sw=4 expandtab
 from twisted.internet.protocol import Protocol
+import os
+import re
+import sys
+sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(__file__),"../../util"))))
+from simlog import getLogger
+
+# a command ends with any of these, only CR and LF end the response line
+delimiters = re.compile(r"([\r\n;])")
 
 class LakeshoreProtocol(Protocol):
     """Protocol object used by the Twisted Infrastructure to handle connections"""
 
     def __init__(self, theDevice, theTerminator = "\r\n"):
-        print LakeshoreProtocol.__name__, "ctor"
+        self.log = theDevice.log.getChild("protocol")
+        self.log.debug("%s ctor", LakeshoreProtocol.__name__)
         self.device = theDevice
-        self.response = ""
+        self.response = []
+        self.responses = []
         self.term = theTerminator
 
     def write(self, response):
-        self.response = self.response + response
+        self.response.append(response)
 
     def connectionMade(self):
         self.pdu = ""
-        self.response = ""
+        self.response = []
+        self.responses = []
         self.device.protocol = self
         self.factory.numProtocols = self.factory.numProtocols + 1
-        print "connectionMade:", self.factory.numProtocols
+        self.log.info("connectionMade: %s", self.factory.numProtocols)
         if self.factory.numProtocols > 2:
-            print "Too many connections - rejecting"
+            self.log.warning("Too many connections - rejecting")
             self.transport.write("Too many connections, try later" + self.term)
             self.transport.loseConnection()
         else:
             self.transport.write(("Welcome connection %d" % self.factory.numProtocols) + self.term)
 
     def connectionLost(self, reason):
-        print "connectionLost:", self.factory.numProtocols, reason
+        self.log.info("connectionLost: %s %s", self.factory.numProtocols, reason)
         self.factory.numProtocols = self.factory.numProtocols - 1
 
     def lineReceived(self, data):
-        print "lineReceived - len:", len(data), data
+        self.log.debug("lineReceived - len: %d %s", len(data), data)
         self.device.protocol = self
         self.device.dataReceived(data)
 
     def dataReceived(self, data):
-        print "dataReceived - len:", len(data), data
-        for c in data:
-            if  c == "\r" or c == ";" or c == "\n":
-                if len(self.pdu) > 0:
-                    self.lineReceived(self.pdu)
-                    self.pdu = ""
-                if c == ";":
-                    if len(self.response) > 0 and self.response[-1] != ";":
-                        self.response = self.response + ";"
-                else:
-                    if len(self.response) > 0:
-                        if self.response[-1] == ";":
-                            self.response = self.response[:-1]
-                    if len(self.response) > 0:
-                        print "Protocol Response: %s" % self.response
-                        self.transport.write(self.response + self.term)
-                        self.response = ""
-            else:
-                self.pdu = self.pdu + c
+        self.log.debug("dataReceived - len: %d %s", len(data), data)
+        fields = delimiters.split(self.pdu + data)
+        self.pdu = fields.pop()
+        output = []
+        for i in range(0, len(fields), 2):
+            pdu, c = fields[i], fields[i + 1]
+            if len(pdu) > 0:
+                self.lineReceived(pdu)
+            if len(self.response) > 0:
+                self.responses.append("".join(self.response))
+                self.response = []
+            if c != ";" and len(self.responses) > 0:
+                response = ";".join(self.responses)
+                self.log.debug("Protocol Response: %s", response)
+                output.append(response + self.term)
+                self.responses = []
+        if len(output) > 0:
+            self.transport.write("".join(output))
 
 if __name__ == '__main__':
     class TestDevice:
         def __init__(self):
             print self.__class__.__name__, "ctor"
+            self.log = getLogger("lakeshore")
         def dataReceived(self, pdu):
             print "test device data received:", pdu
             self.protocol.write("test device response")
@@ -4,52 +4,66 @@
 #
 # Author: Douglas Clowes (2014)
 #
-import inspect
+import os
+import sys
 import traceback
+sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(__file__),"../../util"))))
+from simlog import getLogger
 
 class MercuryDevice(object):
 
+    # command and query method names of each class, found once per class
+    dispatchNames = {}
+
     def __init__(self):
-        print MercuryDevice.__name__, "ctor"
-        #print "Methods:", inspect.getmembers(self, inspect.ismethod)
-        methods = inspect.getmembers(self, inspect.ismethod)
-        self.myMethods = {}
-        for method in methods:
-            self.myMethods[method[0]] = method[1:]
-        #for method in sorted(self.myMethods):
-        #    print "Method:", method, self.myMethods[method], type(method), type(self.myMethods[method])
+        self.log = getLogger("mercury")
+        self.log.debug("%s ctor", MercuryDevice.__name__)
+        commands, queries = self.dispatchTable()
+        self.commands = dict((c, getattr(self, m)) for c, m in commands.items())
+        self.queries = dict((q, getattr(self, m)) for q, m in queries.items())
+
+    @classmethod
+    def dispatchTable(cls):
+        """Maps the commands and queries to the names of the doCommand<X>
+        and doQuery<X> methods of the class"""
+        if cls not in MercuryDevice.dispatchNames:
+            commands = {}
+            queries = {}
+            for name in dir(cls):
+                if name.startswith("doCommand") and len(name) > len("doCommand"):
+                    commands[name[len("doCommand"):]] = name
+                elif name.startswith("doQuery") and len(name) > len("doQuery"):
+                    queries[name[len("doQuery"):]] = name
+            MercuryDevice.dispatchNames[cls] = (commands, queries)
+        return MercuryDevice.dispatchNames[cls]
 
     def reset_powerup(self):
-        print MercuryDevice.__name__, "reset_powerup"
+        self.log.debug("%s reset_powerup", MercuryDevice.__name__)
 
     def write(self, response):
-        print "Device Response: %s" % response
+        self.log.debug("Device Response: %s", response)
         self.protocol.write(response)
 
     def doCommand(self, command, params):
-        print MercuryDevice.__name__, "Command:", command, params
-        method = "doCommand%s" % command
-        if method in self.myMethods:
-            action = "response = self.%s(command, params)" % method
-            print "Action:", action
-            exec action
+        self.log.debug("%s Command: %s %s", MercuryDevice.__name__, command, params)
+        method = self.commands.get(command)
+        if method is not None:
+            response = method(command, params)
             if response:
                 return response
         else:
-            print "Unimplemented Command:", command, params
+            self.log.warning("Unimplemented Command: %s %s", command, params)
         return False
 
     def doQuery(self, command, params):
-        print MercuryDevice.__name__, "Query:", command, params
-        method = "doQuery%s" % command
-        if method in self.myMethods:
-            action = "response = self.%s(command, params)" % method
-            print "Action:", action
-            exec action
+        self.log.debug("%s Query: %s %s", MercuryDevice.__name__, command, params)
+        method = self.queries.get(command)
+        if method is not None:
+            response = method(command, params)
             if response:
                 return response
         else:
-            print "Unimplemented Query:", command, params
+            self.log.warning("Unimplemented Query: %s %s", command, params)
             self.write("Unimplemented Query: %s" % command)
         return False
 
@@ -79,7 +93,7 @@ class MercuryDevice(object):
         return ",".join(mergedParams)
 
     def dataReceived(self, data):
-        print MercuryDevice.__name__, "PDU: \"" + data + "\""
+        self.log.debug("%s PDU: \"%s\"", MercuryDevice.__name__, data)
         command = data.split(":")[0]
         params = data[len(command)+1:].strip().split(":")
         if command[0] == "*":
@@ -49,7 +49,7 @@ class MercurySCPI(MercuryDevice):
 
     def __init__(self):
         MercuryDevice.__init__(self)
-        print MercurySCPI.__name__, "ctor"
+        self.log.debug("%s ctor", MercurySCPI.__name__)
         self.RANDOM = 0.0
         self.IDN = "Simulated Mercury SCPI"
         self.CONFIG_LOOPS = [1, 2, 3, 4]
@@ -65,15 +65,15 @@ class MercurySCPI(MercuryDevice):
         self.reset_powerup()
 
     def doCommand(self, command, params):
-        print MercurySCPI.__name__, "Command:", command, params
+        self.log.debug("%s Command: %s %s", MercurySCPI.__name__, command, params)
         return MercuryDevice.doCommand(self, command, params)
 
     def doQuery(self, command, params):
-        print MercurySCPI.__name__, "Query:", command, params
+        self.log.debug("%s Query: %s %s", MercurySCPI.__name__, command, params)
         return MercuryDevice.doQuery(self, command, params)
 
     def reset_powerup(self):
-        print MercurySCPI.__name__, "reset_powerup"
+        self.log.debug("%s reset_powerup", MercurySCPI.__name__)
         self.LAST_ITERATION = 0
 
     def doIteration(self):
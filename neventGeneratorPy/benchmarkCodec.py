@@ -0,0 +1,79 @@
+from nexus2event import *
+from neventarray import *
+from syntheticEvents import syntheticEvents, layouts
+from pulseCodec import PulseCodec, available
+
+import sys, getopt
+import time
+
+import numpy as np
+
+def usage() :
+    print ""
+    print "Usage:"
+    print "\tpython",sys.argv[0],"[-h -n <repeat> -e <n> -c <codec>] (<nexus file> ...)"
+    print ""
+    print "-h: this help"
+    print "-n: number of timed repetitions (default 3)"
+    print "-e: events per pulse of the synthetic data (default 1000000)"
+    print "-c: only this codec, one of",", ".join(available())
+    print ""
+    print "Measures compression ratio, encoding and decoding speed of every"
+    print "available pulse codec on the NeXus files, or on synthetic pulses of"
+    print "every layout if no file is given, and checks the round trip."
+    print ""
+
+
+def timeit(f,repeat):
+    best = float("inf")
+    for i in range(repeat):
+        start = time.time()
+        result = f()
+        best = min(best,time.time()-start)
+    return best,result
+
+
+def main(argv,repeat=3,nevents=1000000,codecs=None):
+    if len(argv) > 0:
+        cases = [(source,loadNeXus2event(source)) for source in argv]
+    else:
+        cases = [(l,syntheticEvents(nevents,1,layout=l,seed=0)[0]) for l in layouts]
+
+    for name,data in cases:
+        print name,":",data.size,"events,",data.nbytes/1e6,"MB"
+        for method in codecs or available():
+            codec = PulseCodec(method)
+            tEncode,encoded = timeit(lambda: codec.encode(data),repeat)
+            tDecode,decoded = timeit(lambda: codec.decode(encoded.tobytes()),repeat)
+
+            if decoded.tobytes() != data.tobytes():
+                raise Exception("Round trip differs",name,method)
+
+            print "\t%-12s ratio %6.2f encode %8.1f MB/s decode %8.1f MB/s" % (
+                method,data.nbytes/float(max(encoded.nbytes,1)),
+                data.nbytes/1e6/max(tEncode,1e-9),data.nbytes/1e6/max(tDecode,1e-9))
+
+
+if __name__ == "__main__":
+    try:
+        opts,args = getopt.getopt(sys.argv[1:], "hn:e:c:",["help","repeat=","events=","codec="])
+    except getopt.GetoptError as err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    repeat = 3
+    nevents = 1000000
+    codecs = None
+    for o,a in opts:
+        if o in ("-h","--help"):
+            usage()
+            sys.exit()
+        if o in ("-n","--repeat"):
+            repeat = int(a)
+        if o in ("-e","--events"):
+            nevents = int(a)
+        if o in ("-c","--codec"):
+            codecs = [a]
+
+    main(args,repeat,nevents,codecs)
@@ -0,0 +1,140 @@
+from nexus2event import *
+from neventarray import *
+
+import sys, getopt
+import time
+
+import numpy as np
+import nxs
+
+def usage() :
+    print ""
+    print "Usage:"
+    print "\tpython",sys.argv[0],"[-h -n <repeat>] <nexus file> (<nexus file> ...)"
+    print ""
+    print "-h: this help"
+    print "-n: number of timed repetitions (default 3)"
+    print ""
+    print "Compares the NumPy event expansion of nexus2event against the"
+    print "reference per-bin loop and checks that both produce the same events."
+    print ""
+
+
+def read(path, source):
+    f = nxs.open(source,'r')
+    f.openpath(path)
+    data = f.getdata()
+    f.close()
+    return data
+
+
+def loopAMOR(data,tof):
+    dim = data.shape
+    signal = np.zeros(np.sum(data),dtype=event_t)
+
+    nEv = 0
+    for row in range(dim[0]):
+        for col in range(dim[1]):
+            for it in range(dim[2]):
+                events = data[row][col][it]
+                if events > 0:
+                    signal[nEv:nEv+events]["ts"] = round(tof[it]/10.)
+                    signal[nEv:nEv+events]["data"] = col << 12 | row
+                    nEv = nEv+events
+    return signal
+
+
+def loopFOCUS(data):
+    dim = data.shape
+    signal = np.zeros(np.sum(data),dtype=event_t)
+
+    nEv = 0
+    for row in range(dim[0]):
+        for it in range(dim[1]):
+            events = data[row][it]
+            if events > 0:
+                signal[nEv:nEv+events]["data"] = it << 12 | row
+                nEv = nEv+events
+    return signal
+
+
+def loopRITA2(data):
+    dim = data.shape
+
+    np.random.seed(1234)
+    timestamp = np.sort(np.random.randint(2**32-1,size=dim[0]))
+
+    signal = np.zeros(np.sum(data),dtype=event_t)
+
+    nEv = 0
+    for row in range(dim[1]):
+        for col in range(dim[2]):
+            for it in range(dim[0]):
+                events = data[it][row][col]
+                if events > 0:
+                    signal[nEv:nEv+events]["ts"] = timestamp[it]
+                    signal[nEv:nEv+events]["data"] = (0 << 31 | 0 << 30 | 1 << 29 | 1 << 28 | 2 << 24 | col << 12 | row )
+                    nEv = nEv+events
+    return signal
+
+
+def cases(source):
+    if "amor" in source:
+        data = read("entry1/AMOR/area_detector/data",source)
+        tof = read("entry1/AMOR/area_detector/time_binning",source)
+        return (lambda: loopAMOR(data,tof)), (lambda: expandAMOR(data,tof))
+    if "focus" in source:
+        data = read("entry1/FOCUS/merged/counts",source)
+        return (lambda: loopFOCUS(data)), (lambda: expandFOCUS(data))
+    if "rita" in source:
+        data = read("entry1/RITA-2/detector/counts",source)
+        return (lambda: loopRITA2(data)), (lambda: expandRITA2(data))
+    raise NotImplementedError("Detector not implemented")
+
+
+def timeit(f,repeat):
+    best = float("inf")
+    for i in range(repeat):
+        start = time.time()
+        result = f()
+        best = min(best,time.time()-start)
+    return best,result
+
+
+def main(argv,repeat=3):
+    for source in argv:
+        loop,vectorized = cases(source)
+
+        tLoop,reference = timeit(loop,repeat)
+        tVectorized,signal = timeit(vectorized,repeat)
+
+        if reference.tobytes() != signal.tobytes():
+            raise Exception("Vectorized expansion differs from reference",source)
+
+        print source,":",signal.size,"events"
+        print "\tloop       ",tLoop,"s"
+        print "\tvectorized ",tVectorized,"s"
+        print "\tspeedup    ",tLoop/max(tVectorized,1e-9)
+
+
+if __name__ == "__main__":
+    try:
+        opts,args = getopt.getopt(sys.argv[1:], "hn:",["help","repeat="])
+    except getopt.GetoptError as err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    if len(args) < 1:
+        usage()
+        exit(2)
+
+    repeat = 3
+    for o,a in opts:
+        if o in ("-h","--help"):
+            usage()
+            sys.exit()
+        if o in ("-n","--repeat"):
+            repeat = int(a)
+
+    main(args,repeat)
@@ -2,32 +2,32 @@
 # 
 # fake SINQ EL737 counter box
 #
-# I am using 1000cts/sec for m1, 500 for m2, 300 for m3 and 2000 for m4
+# Counts are simulated by countModel.CountModel: m1 counts the streamed
+# events, the other counters are Poisson with 1500, 500, 300 and 2000 cts/sec
 #
 # Mark Koennecke, July 2015
 #----------------------------------------------------------------------
 from twisted.internet import reactor, protocol
+from twisted.internet.threads import deferToThread
 from twisted.protocols.basic import LineReceiver
 import time
+import os
 import sys
+sys.path.insert(0, os.path.realpath(os.path.abspath(os.path.join(os.path.dirname(__file__),"../util"))))
 
 import zmq
 from nexus2event import *
 from neventarray import *
-import threading
+from eventCache import loadCachedNeXus2event
+from pulseProducer import PulseProducer
+from countModel import CountModel
+from pulseCodec import PulseCodec
 
 class EL737Controller(LineReceiver):
     def __init__(self):
         self.remotestate = 0
         self.delimiter = '\r'
-        self.mode = 'timer'
-        self.preset = .0
-        self.starttime = time.time()
-        self.endtime = time.time()
-        self.counting = False
-        self.mypaused = False
-        self.pausestart = 0
-        self.pausedTime = 0.
+        self.counts = CountModel()
         self.threshold = 0
         self.thresholdcounter = 1
 
@@ -35,30 +35,24 @@ class EL737Controller(LineReceiver):
         self.socket = []
         self.source = []
         self.multiplier = 1
-        self.Stop = False
+        self.codec = PulseCodec()
+        self.data = None
+        self.producer = None
         self.dtype = event_t
 
+    def connectionLost(self, reason):
+        self.counts.stop()
+        if self.producer is not None:
+            self.producer.stop()
+            self.producer = None
+        if self.socket:
+            self.socket.close(linger=0)
+
     def write(self, data):
         print "transmitted:", data
         if self.transport is not None: 
             self.transport.write(data)
     
-    def calculateCountStatus(self):
-        if self.counting and not self.mypaused :
-            runtime = time.time() - self.starttime - self.pausedTime
-            print(str(runtime) + ' versus ' + str(self.preset))
-            if self.mode == 'timer':
-                if runtime >= self.preset:
-                    self.counting = False
-                    self.endtime = self.starttime + self.preset
-                    self.pausedTime = 0
-            else:
-                if runtime*1000 >= self.preset:
-                    self.counting = False
-                    self.endtime = self.starttime + self.preset/1000
-        print('count flag after calculateCountStatus ' + str(self.counting))
-
-
     def lineReceived(self, data):
         print "lineReceived:", data
 
@@ -66,12 +60,13 @@ class EL737Controller(LineReceiver):
             if data.startswith('init'):
                 """Enbles the event generator. Syntax:
 
-                >>> init <NeXus file> <port> (<multiplier>)
+                >>> init <NeXus file> <port> (<multiplier>) (<compression>)
                 
                 Args:
                 NeXus file (str):  the NeXus file from which extract data
                 port       (int):  the port to use for zmq communications
                 multiplier (int):  allows to produce replicas of raw data to mimic a larger message
+                compression (str): compress the pulses, see pulseCodec.PulseCodec
                 
                 It does not start the generation, simply sets up the
                 environment. To run the event generation use >>> run
@@ -81,11 +76,14 @@ class EL737Controller(LineReceiver):
                 """
                 self.socket = self.context.socket(zmq.PUSH)
                 self.socket.bind("tcp://127.0.0.1:"+data.split(" ")[2])
+                self.socket.setsockopt(zmq.SNDHWM, 100)
                 self.write("zmq connected on port "+data.split(" ")[2])
                 self.write("\r")
                 self.source = data.split(" ")[1]
                 if len(data.split(" ")) > 3:
                     self.multiplier = int(data.split(" ")[3])
+                if len(data.split(" ")) > 4:
+                    self.codec = PulseCodec(data.split(" ")[4])
                 self.remotestate = 1
             return
 
@@ -118,9 +116,7 @@ class EL737Controller(LineReceiver):
 
                     """
                     self.remotestate = 2
-                    thread = threading.Thread(target=self.start)
-                    thread.daemon = True
-                    thread.start()
+                    self.start()
                 else:
                     self.write("?loc\r")
             return
@@ -134,45 +130,28 @@ class EL737Controller(LineReceiver):
 
            if data.startswith('mp'):
                l = data.split()
-               self.mode = 'monitor'
-               self.preset = float(l[1])
-               self.starttime = time.time()
-               self.mypaused = False
-               self.pausedTime = 0.
-               self.counting = True
+               self.counts.start('monitor',float(l[1]))
                self.write('\r')
                return
                
            if data.startswith('tp'):
                l = data.split()
-               self.mode = 'timer'
-               self.preset = float(l[1])
-               self.starttime = time.time()
-               self.mypaused = False
-               self.pausedTime = 0.
-               self.counting = True
+               self.counts.start('timer',float(l[1]))
                self.write('\r')
                return
                
            if data.startswith('s'):
-               self.counting = False
-               self.endtime = time.time()
+               self.counts.stop()
                self.write('\r')
                return
 
            if data.startswith('ps'):
-               self.counting = True
-               self.mypaused = True
-               self.pausestart = time.time()
+               self.counts.pause()
                self.write('\r')
                return
 
            if data.startswith('co'):
-               if not self.mypaused:
-                   pass
-               else:
-                   self.mypaused = False
-                   self.pausedTime  += time.time() - self.pausestart
+               self.counts.resume()
                self.write('\r')
                return
 
@@ -193,15 +172,14 @@ class EL737Controller(LineReceiver):
                    self.write(str(self.thresholdcounter) + '\r')
 
            if data.startswith('rs'):
-               self.calculateCountStatus()
-               if self.counting:
-                   if self.mypaused:
-                       if self.mode == 'timer':
+               if self.counts.counting:
+                   if self.counts.paused:
+                       if self.counts.mode == 'timer':
                            self.write('9\r')
                        else:
                            self.write('10\r')
                    else:
-                       if self.mode == 'timer':
+                       if self.counts.mode == 'timer':
                            self.write('1\r')
                        else:
                            self.write('2\r')
@@ -209,26 +187,22 @@ class EL737Controller(LineReceiver):
                    self.write('0\r')
                return
 
-           if data.startswith('ra'):
-               self.calculateCountStatus()
-               if self.counting:
-                   if self.mypaused:
-                       pausetime = time.time() - self.pausestart
-                   else:
-                       pausetime = self.pausedTime
-                   diff = time.time() - self.starttime - pausetime
+           if data.startswith('rate'):
+               l = data.split()
+               if len(l) > 1:
+                   rates = [float(r) for r in l[1:]]
+                   self.counts.setRates((rates+[0.]*8)[:8])
+                   self.write('\r')
                else:
-                   diff = self.endtime - self.starttime
+                   self.write(' '.join([str(r) for r in self.counts.rates]) + '\r')
+               return
+
+           if data.startswith('ra'):
+               diff, counts = self.counts.read()
                rlist = []
                rlist.append(str(diff))
-               rlist.append(str(int(diff*1000)))
-               rlist.append(str(int(diff*1500)))
-               rlist.append(str(int(diff*500)))
-               rlist.append(str(int(diff*300)))
-               rlist.append(str(int(diff*2000)))
-               rlist.append('0')
-               rlist.append('0')
-               rlist.append('0')
+               for c in counts:
+                   rlist.append(str(c))
                rastring = ' '.join(rlist)
                self.write(rastring +'\r')
                return
@@ -241,43 +215,42 @@ class EL737Controller(LineReceiver):
 
 
     def start(self):
+        if self.producer is not None:
+            print "Nothing to do, generator already started"
+            return
         print "generator started"
-        data = loadNeXus2event(self.source)
-
-        if self.multiplier > 1:
-            data = multiplyNEventArray(data,int(self.multiplier))
-
-        ctime=time.time()
-        pulseID=0
-        count = 0
-        
-        while not self.Stop:
-            itime = time.time()
-            dataHeader=header(pulseID,itime)
-            
-            def send_data(data,socket,head):
-                socket.send_json(head,zmq.SNDMORE)
-                socket.send(data)
-
-            if self.mypaused == False:
-                send_data(data,self.socket,dataHeader)
-                count += 1
-
-            elapsed = time.time() - itime
-            remaining = 1./14-elapsed
-
-            if remaining > 0:
-                time.sleep (remaining)
-
-            pulseID += 1
-
-            if time.time()-ctime > 10 :
-                size = (data.size*self.dtype.itemsize+
-                        sys.getsizeof(dataHeader))
-
-                print "Sent ",count," events @ ",size*count/(10.*1e6)," MB/s"
-                count = 0
-                ctime = time.time()
+        self.producer = PulseProducer(self.socket,self.sendPulse)
+        d = deferToThread(self.load)
+        d.addCallback(self.loaded)
+        d.addErrback(self.failed)
+
+    def load(self):
+        data = loadCachedNeXus2event(self.source)
+        self.codec.precompute([data])
+        return data
+
+    def loaded(self, data):
+        if self.producer is None:
+            # the connection was lost while loading
+            return
+        self.data = data
+        self.counts.stream()
+        self.producer.start()
+
+    def failed(self, failure):
+        print "Unable to load",self.source,":",failure.getErrorMessage()
+        self.producer = None
+
+    def sendPulse(self, socket, pulseID, flags):
+        if self.counts.paused:
+            return None
+
+        dataHeader=self.codec.tagHeader(header(pulseID,time.time(),ne=self.data.size*self.multiplier))
+        frames = self.codec.encodeFrames([self.data])
+        socket.send(dataHeader,flags|zmq.SNDMORE)
+        sendNEventFrames(socket,frames,self.multiplier)
+        self.counts.addEvents(self.data.size*self.multiplier)
+        return len(dataHeader)+frames[0].nbytes*self.multiplier
 
 
 
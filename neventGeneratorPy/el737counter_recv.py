@@ -5,6 +5,10 @@
 # I am using 1000cts/sec for m1, 500 for m2, 300 for m3 and 2000 for m4
 #
 # Mark Koennecke, July 2015
+#
+# The receiver reports the events it actually received instead: ra returns
+# the total, the events inside the live detector histogram and the ones
+# outside of it as the first three counters.
 #----------------------------------------------------------------------
 from twisted.internet import reactor, protocol
 from twisted.protocols.basic import LineReceiver
@@ -19,6 +23,9 @@ import json
 
 from nexus2event import *
 from neventarray import *
+from eventHistogram import EventHistogram
+from receiverStats import ReceiverStats
+from pulseCodec import decodeFrames
 
 class EL737Controller(LineReceiver):
     def __init__(self):
@@ -38,11 +45,14 @@ class EL737Controller(LineReceiver):
         self.context = zmq.Context()
         self.socket = []
         self.source = []
-        self.size = 0
-        self.count = 0
+        self.statistics = ReceiverStats()
+        self.interval = ReceiverStats()
         self.dtype = event_t
         self.Stop = False
+        self.debug = None
+        self.histogram = EventHistogram()
         self.of = []
+        self.idx = []
 
     def write(self, data):
         print "transmitted:", data
@@ -72,11 +82,14 @@ class EL737Controller(LineReceiver):
             if data.startswith('init'):
                 """Enbles the event reader. Syntax:
 
-                >>> init <address>:<port>
+                >>> init <address>:<port> (<nx> <ny> <ntof> <tofmax>)
                 
                 Args:
                 port       (int):  tcp/ip address to listen for
                 port       (int):  the port to use for zmq communications
+                nx, ny     (int):  size of the live detector histogram
+                ntof       (int):  number of bins of the live TOF histogram
+                tofmax     (int):  timestamp range of the TOF histogram
                 
                 It does not start the reader, simply sets up the
                 environment. To run the reader use >>> run
@@ -86,6 +99,8 @@ class EL737Controller(LineReceiver):
                 """
                 self.socket = self.context.socket(zmq.PULL)
                 self.socket.connect(data.split(" ")[1])
+                if len(data.split()) > 2:
+                    self.histogram = EventHistogram(*[int(a) for a in data.split()[2:6]])
                 self.write("zmq connected to "+data.split(" ")[1])
                 self.write("\r")
                 self.remotestate = 1
@@ -121,6 +136,7 @@ class EL737Controller(LineReceiver):
                     """
                     self.counting = True
                     self.mypaused = False
+                    self.statistics.reset()
 
                     self.remotestate = 2
                     thread = threading.Thread(target=self.start)
@@ -130,13 +146,24 @@ class EL737Controller(LineReceiver):
                     if data.startswith("debug"):
                         """Runs the event generator in debug mode. Syntax:
 
-                        >>> debug
+                        >>> debug (bin)
+
+                        Every pulse received is dumped to file: as text
+                        (header followed by one "(ts, data)" line per
+                        event), or with bin the events go raw to a .bin
+                        file and the headers to a .txt index.
 
                         """
                         self.counting = True
                         self.mypaused = False
-                        self.dtype = debug_t
-                        self.of = open("dump_"+datetime.now().strftime("%Y-%m-%dT%H:%M:%S")+".txt","w")
+                        name = "dump_"+datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+                        if data.split()[-1] == "bin":
+                            self.debug = "bin"
+                            self.of = open(name+".bin","wb")
+                            self.idx = open(name+".txt","w")
+                        else:
+                            self.debug = "text"
+                            self.of = open(name+".txt","w")
                         self.remotestate = 2
                         thread = threading.Thread(target=self.start)
                         thread.daemon = True
@@ -156,6 +183,8 @@ class EL737Controller(LineReceiver):
                l = data.split()
                self.mode = 'monitor'
                self.preset = float(l[1])
+               self.histogram.reset()
+               self.statistics.reset()
                self.starttime = time.time()
                self.mypaused = False
                self.pausedTime = 0.
@@ -167,6 +196,8 @@ class EL737Controller(LineReceiver):
                l = data.split()
                self.mode = 'timer'
                self.preset = float(l[1])
+               self.histogram.reset()
+               self.statistics.reset()
                self.starttime = time.time()
                self.mypaused = False
                self.pausedTime = 0.
@@ -174,6 +205,26 @@ class EL737Controller(LineReceiver):
                self.write('\r')
                return
                
+           if data.startswith('stat'):
+               """Reports the receiver statistics since run, tp or mp. Syntax:
+
+               >>> status
+
+               Returns pulses, events and bytes received, bandwidth,
+               lost, reordered and duplicated pulses, generator
+               restarts, then p50/p99/max of latency, inter-arrival
+               time and jitter in ms.
+
+               """
+               st = self.statistics.summary()
+               rlist = [str(st[k]) for k in ("pulses","events","bytes")]
+               rlist.append("%.3f" % st["bandwidth"])
+               rlist += [str(st[k]) for k in ("lost","reordered","duplicated","restarts")]
+               for k in ("latency","interarrival","jitter"):
+                   rlist += ["%.3f" % (1e3*t) for t in st[k]]
+               self.write(' '.join(rlist)+'\r')
+               return
+
            if data.startswith('s'):
                self.counting = False
                self.endtime = time.time()
@@ -241,11 +292,11 @@ class EL737Controller(LineReceiver):
                    diff = self.endtime - self.starttime
                rlist = []
                rlist.append(str(diff))
-               rlist.append(str(int(diff*1000)))
-               rlist.append(str(int(diff*1500)))
-               rlist.append(str(int(diff*500)))
-               rlist.append(str(int(diff*300)))
-               rlist.append(str(int(diff*2000)))
+               rlist.append(str(self.histogram.total))
+               rlist.append(str(self.histogram.total-self.histogram.outside))
+               rlist.append(str(self.histogram.outside))
+               rlist.append('0')
+               rlist.append('0')
                rlist.append('0')
                rlist.append('0')
                rlist.append('0')
@@ -257,6 +308,23 @@ class EL737Controller(LineReceiver):
                self.write('EL737 Neutron Counter V8.02\r')
                return
 
+           if data.startswith('hs'):
+               """Saves the live histograms. Syntax:
+
+               >>> hs <file>
+
+               Writes the detector image, the TOF histogram and its bin
+               edges to <file>.npz
+
+               """
+               l = data.split()
+               if len(l) < 2:
+                   self.write('?2\r')
+                   return
+               self.histogram.save(l[1])
+               self.write('\r')
+               return
+
            self.write('?2\r')
 
 
@@ -264,13 +332,32 @@ class EL737Controller(LineReceiver):
         while not self.Stop:
 
             time.sleep(10)
-            print "Received",self.count,"events (",self.size/1.e6,"MB) @ ",self.size*self.count/(10.*1e6)," MB/s"
-            self.count = 0
+            interval,self.interval = self.interval,ReceiverStats()
+            print "Received",interval
+
+
+    def dump(self,headers,pulses,events):
+        if self.debug == "bin":
+            events.tofile(self.of)
+            for h,p in zip(headers,pulses):
+                self.idx.write(json.dumps(h)+" "+str(p.size)+"\n")
+            self.idx.flush()
+        else:
+            for h,p in zip(headers,pulses):
+                self.of.write(json.dumps(h)+"\n")
+                writeNEventText(self.of,p)
+        self.of.flush()
+        os.fsync(self.of.fileno())
+
+    def process(self,ring):
+        batch = ring.drain()
+        if self.debug is not None:
+            self.dump(*batch)
 
 
     def start(self):
 
-        pulseID=0
+        ring = NEventRing()
         
         thread = threading.Thread(target=self.stats)
         thread.daemon = True
@@ -279,27 +366,24 @@ class EL737Controller(LineReceiver):
         while not self.Stop:
 
             if not self.mypaused:
-                dataHeader = self.socket.recv_json()
-                buf = self.socket.recv(copy=True)
-                data = np.frombuffer(buffer(buf),dtype=event_t)
-                if self.dtype == debug_t:
-                    self.of.write(json.dumps(dataHeader))
-                    for i in data:
-                        self.of.write(str(i)+"\n")
-                    self.of.flush()
-                    os.fsync(self.of.fileno())
-                self.count += 1
-                self.size = (data.size*event_t.itemsize+
-                        sys.getsizeof(dataHeader))
-
-                if dataHeader["ts"] > pulseID:
-                    while not int(dataHeader["ts"]) == (pulseID+1):
-                        print "Lost pulse ",pulseID
-                        pulseID += 1
-                if dataHeader["ts"] < pulseID:
-                        pulseID = dataHeader["ts"]
-
-            pulseID += 1
+                message = self.socket.recv()
+                dataHeader = parseHeader(message)
+                frames = recvFrames(self.socket)
+                nbytes = len(message)+sum([len(f) for f in frames])
+                frames = decodeFrames(dataHeader,frames)
+                nevents = sum([f.size for f in frames])
+                self.statistics.record(dataHeader,nbytes,nevents)
+                self.interval.record(dataHeader,nbytes,nevents)
+                if self.counting:
+                    for f in frames:
+                        self.histogram.add(f)
+                if self.debug is not None:
+                    if not ring.fits(frames):
+                        self.process(ring)
+                    ring.push(dataHeader,frames)
+                    if ring.full():
+                        self.process(ring)
+        self.process(ring)
         print "execution stopped"
         thread.stop()
 
@@ -0,0 +1,74 @@
+import os
+import glob
+import hashlib
+import tempfile
+
+import numpy as np
+
+from nexus2event import loadNeXus2event, detectorType
+from neventarray import multiplyNEventArray
+
+# The expanded event array of a NeXus file is stored as a .npy sidecar,
+# next to the source file if possible, in the temporary directory
+# otherwise. The sidecar name carries detector type, multiplier and source
+# mtime, so a modified source file is never served from a stale cache.
+# Sidecars are memory mapped copy-on-write: generators running on the same
+# file share the page cache, and in-place mutations stay private.
+
+def cacheDirs():
+    return [None, tempfile.gettempdir()]
+
+
+def cachePath(source,multiplier=1,cachedir=None):
+    source = os.path.abspath(source)
+    if cachedir is None:
+        prefix = source
+    else:
+        prefix = os.path.join(cachedir,
+                              hashlib.md5(source).hexdigest()[:12]+"_"+
+                              os.path.basename(source))
+
+    return "%s.%s.x%d.%d.npy" % (prefix,detectorType(source),multiplier,
+                                 int(os.stat(source).st_mtime*1e6))
+
+
+def store(data,path):
+    tmp = path+".%d.tmp" % os.getpid()
+    with open(tmp,"wb") as f:
+        np.save(f,data)
+    os.rename(tmp,path)
+
+    for stale in glob.glob(path.rsplit(".",2)[0]+".*.npy"):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def loadCachedNeXus2event(source,multiplier=1):
+    if not os.path.isfile(source) :
+        raise IOError
+
+    multiplier = max(int(multiplier),1)
+
+    for cachedir in cacheDirs():
+        path = cachePath(source,multiplier,cachedir)
+        if os.path.isfile(path):
+            print "Mapping events from cache " + path
+            return np.load(path,mmap_mode="c")
+
+    data = loadNeXus2event(source)
+    if multiplier > 1:
+        data = multiplyNEventArray(data,multiplier)
+
+    for cachedir in cacheDirs():
+        path = cachePath(source,multiplier,cachedir)
+        try:
+            store(data,path)
+        except (IOError,OSError) as err:
+            print "Unable to write event cache " + path + ": " + str(err)
+            continue
+        return np.load(path,mmap_mode="c")
+
+    return data
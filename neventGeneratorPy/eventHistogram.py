@@ -0,0 +1,52 @@
+import numpy as np
+
+def decode(data):
+    """Splits the packed data word of the events into x, y and flags."""
+    return data & 0xfff, (data >> 12) & 0xfff, data >> 24
+
+
+class EventHistogram:
+    """Live detector (x, y) and time of flight histograms of the received
+    events.
+
+    Args:
+    nx, ny  (int): size of the detector image; events outside are only
+                   counted in outside
+    ntof    (int): number of time of flight bins
+    tofmax  (int): timestamps from 0 to tofmax are binned, later ones go
+                   to the last bin
+    """
+
+    def __init__(self,nx=1024,ny=1024,ntof=1000,tofmax=100000):
+        self.nx = nx
+        self.ny = ny
+        self.ntof = ntof
+        self.tofmax = tofmax
+        self.reset()
+
+    def reset(self):
+        self.detector = np.zeros((self.ny,self.nx),dtype=np.int64)
+        self.tof = np.zeros(self.ntof,dtype=np.int64)
+        self.total = 0
+        self.outside = 0
+
+    def add(self,events):
+        if events.size == 0:
+            return
+        x,y,flags = decode(events["data"])
+
+        inside = (x < self.nx) & (y < self.ny)
+        pixel = (y*self.nx+x)[inside]
+        counts = np.bincount(pixel)
+        self.detector.flat[:counts.size] += counts
+
+        bins = np.minimum(events["ts"].astype(np.int64)*self.ntof//self.tofmax,self.ntof-1)
+        counts = np.bincount(bins)
+        self.tof[:counts.size] += counts
+
+        self.total += events.size
+        self.outside += events.size-pixel.size
+
+    def save(self,name):
+        np.savez(name,detector=self.detector,tof=self.tof,
+                 tofbins=np.linspace(0,self.tofmax,self.ntof+1))
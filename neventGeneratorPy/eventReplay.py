@@ -0,0 +1,149 @@
+import time
+import json
+
+import numpy as np
+
+try:
+    import nxs
+except ImportError:
+    nxs = None
+
+from neventarray import event_t
+from pulseClock import monotonic, LatenessHistogram
+
+def recordedPulses(name):
+    """Pulses of a recording made with 'debug bin' by el737counter_recv:
+    the events are memory-mapped from <name>.bin, <name>.txt has the
+    header and the number of events of every pulse. Yields the send time
+    of the pulse and its events.
+    """
+    events = np.memmap(name+".bin",dtype=event_t,mode="r")
+    start = 0
+    with open(name+".txt") as index:
+        for line in index:
+            header,n = line.rsplit(" ",1)
+            n = int(n)
+            yield float(json.loads(header).get("st",0.)),events[start:start+n]
+            start += n
+
+
+def eventListPulses(events,period=1/14.,tick=100e-9,chunk=1<<20):
+    """Slices a time ordered event list, whose timestamps are ticks since
+    the start of the measurement, into pulses of period seconds. The list
+    is read chunk events at a time, so it can be a memory-mapped file
+    larger than RAM. Yields the start time of every pulse in seconds and
+    its events, with timestamps relative to the start of the pulse;
+    pulses without events are yielded empty.
+    """
+    width = max(int(round(period/tick)),1)
+    pending = events[:0]
+    pulse = None
+    for i in range(0,events.size,chunk):
+        block = np.concatenate((pending,events[i:i+chunk]))
+        ids = block["ts"]//width
+        if pulse is None:
+            pulse = int(ids[0])
+        last = int(ids[-1])
+        bounds = np.searchsorted(ids,np.arange(pulse,last+1))
+        for k in range(last-pulse):
+            p = block[bounds[k]:bounds[k+1]]
+            p["ts"] -= (pulse+k)*width
+            yield (pulse+k)*width*tick,p
+        pending = block[bounds[-1]:]
+        pulse = last
+
+    if pulse is not None:
+        pending["ts"] -= pulse*width
+        yield pulse*width*tick,pending
+
+
+def findEventData(f,path=""):
+    for name,nxclass in f.getentries().items():
+        if nxclass == "NXevent_data":
+            return path+"/"+name
+        if nxclass.startswith("NX"):
+            f.opengroup(name,nxclass)
+            found = findEventData(f,path+"/"+name)
+            f.closegroup()
+            if found is not None:
+                return found
+    return None
+
+
+def readSlab(f,path,start,size):
+    f.openpath(path)
+    return f.getslab([start],[size])
+
+
+def nexusPulses(source,path=None,chunk=1000):
+    """Pulses of the NXevent_data group at path (the first one found by
+    default) of a NeXus event file, read chunk pulses at a time. Yields
+    the time of the pulse in seconds and its events: event_time_offset as
+    timestamp and event_id as data word, both unchanged.
+    """
+    if nxs is None:
+        raise ImportError("the nxs NeXus bindings are needed to replay "+source)
+    f = nxs.open(source,'r')
+    try:
+        if path is None:
+            path = findEventData(f)
+            if path is None:
+                raise IOError("No NXevent_data in "+source)
+
+        f.openpath(path+"/event_index")
+        npulses = f.getinfo()[0][0]
+        f.openpath(path+"/event_id")
+        nevents = f.getinfo()[0][0]
+
+        for i in range(0,npulses,chunk):
+            n = min(chunk,npulses-i)
+            t0 = readSlab(f,path+"/event_time_zero",i,n)
+            if np.issubdtype(t0.dtype,np.integer):
+                t0 = t0*1e-9
+            index = np.append(readSlab(f,path+"/event_index",i,n),
+                              nevents if i+n == npulses else readSlab(f,path+"/event_index",i+n,1))
+            first,size = int(index[0]),int(index[-1]-index[0])
+
+            events = np.empty(size,dtype=event_t)
+            events["ts"] = readSlab(f,path+"/event_time_offset",first,size)
+            events["data"] = readSlab(f,path+"/event_id",first,size)
+            index -= first
+            for k in range(n):
+                yield float(t0[k]),events[index[k]:index[k+1]]
+    finally:
+        f.close()
+
+
+def replayPulses(source,period=1/14.,tick=100e-9,path=None):
+    """Picks the reader from the file name: a 'debug bin' recording
+    (.bin), a time ordered event list (.npy) or a NeXus event file.
+    """
+    if source.endswith(".bin"):
+        return recordedPulses(source[:-4])
+    if source.endswith(".npy"):
+        return eventListPulses(np.load(source,mmap_mode="r"),period,tick)
+    return nexusPulses(source,path)
+
+
+class ReplayClock:
+    """Paces replayed pulses at their recorded times, speed times faster
+    than recorded; a speed of 0 replays them as fast as possible. The
+    lateness of every pulse is histogrammed like PulseClock does.
+    """
+
+    def __init__(self,speed=1.):
+        self.speed = speed
+        self.start = None
+        self.histogram = LatenessHistogram()
+
+    def wait(self,t):
+        """Blocks until the pulse recorded at t (seconds) is due."""
+        if self.speed <= 0:
+            return
+        now = monotonic()
+        if self.start is None:
+            self.start = (now,t)
+        deadline = self.start[0]+(t-self.start[1])/self.speed
+        if deadline > now:
+            time.sleep(deadline-now)
+        self.histogram.record(monotonic()-deadline)
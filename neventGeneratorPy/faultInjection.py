@@ -0,0 +1,140 @@
+import numpy as np
+
+class FaultInjector:
+    """Injects errors into the generated pulses to soak-test consumers.
+
+    Args:
+    faults   (str):   comma separated list of the faults to inject, or
+                      "all" / "none":
+                      nev   drop events
+                      ts    set event timestamps to 0xffffffff
+                      pos   set x or y of events to 4095 (out of range)
+                      dup   send the pulse twice
+                      order send the pulse after the next one
+    rate     (float): probability of each enabled fault per pulse
+    nevents  (int):   at most this many events are affected by nev/ts/pos
+    batch    (int):   random draws are made for this many pulses at once
+
+    The event buffer is never copied nor modified: a faulty pulse is sent
+    as zero-copy slices of the original buffer around the affected
+    events, with only the affected events copied and patched.
+    """
+
+    kinds = ("nev","ts","pos","dup","order")
+
+    def __init__(self,faults="none",rate=.01,nevents=4,batch=1024,seed=None):
+        self.rng = np.random.RandomState(seed)
+        self.nevents = nevents
+        self.batch = batch
+        self.held = None
+        self.counts = dict([(k,0) for k in self.kinds])
+        self.faults = None
+        self.rate = None
+        self.configure(faults,rate)
+
+    def configure(self,faults,rate=.01):
+        if (faults,rate) == (self.faults,self.rate):
+            return
+        self.faults = faults
+        self.rate = rate
+
+        if faults == "all":
+            enabled = self.kinds
+        elif faults == "none":
+            enabled = ()
+        else:
+            enabled = [f.strip() for f in faults.split(",")]
+            for f in enabled:
+                if f not in self.kinds:
+                    raise ValueError("Unknown mutation",f)
+        self.rates = np.array([rate if k in enabled else 0. for k in self.kinds])
+        self.enabled = len(enabled) > 0
+        self.refill()
+
+    def refill(self):
+        shape = (self.batch,len(self.kinds))
+        self.masks = self.rng.random_sample(shape) < self.rates
+        self.anyMask = self.masks.any(axis=1)
+        self.nAffected = self.rng.randint(1,self.nevents+1,size=(self.batch,3))
+        self.where = self.rng.random_sample((self.batch,3,self.nevents))
+        self.axis = self.rng.randint(2,size=(self.batch,2*self.nevents))
+        self.next = 0
+
+    def stats(self):
+        """Returns and resets the number of injected faults per kind."""
+        counts = self.counts
+        self.counts = dict([(k,0) for k in self.kinds])
+        return counts
+
+    def apply(self,header,data):
+        """Returns the list of (header, frames) messages to send for the
+        pulse, frames being buffers that together make up its events.
+        """
+        if not self.enabled:
+            return [(header,[data])]
+
+        if self.next == self.batch:
+            self.refill()
+        i = self.next
+        self.next += 1
+
+        if not self.anyMask[i]:
+            if self.held is None:
+                return [(header,[data])]
+            messages = [(header,[data]),self.held]
+            self.held = None
+            return messages
+
+        mask = self.masks[i]
+        message = (header,self.corrupt(data,i,mask))
+
+        if mask[4] and self.held is None:
+            self.counts["order"] += 1
+            self.held = message
+            return []
+
+        messages = [message]
+        if mask[3]:
+            self.counts["dup"] += 1
+            messages.append(message)
+        if self.held is not None:
+            messages.append(self.held)
+            self.held = None
+        return messages
+
+    def corrupt(self,data,i,mask):
+        if not (mask[0] or mask[1] or mask[2]) or data.size == 0:
+            return [data]
+
+        def pick(kind):
+            if not mask[kind]:
+                return np.empty(0,dtype=np.intp)
+            self.counts[self.kinds[kind]] += 1
+            n = self.nAffected[i,kind]
+            return np.unique((self.where[i,kind,:n]*data.size).astype(np.intp))
+
+        dropped = pick(0)
+        ts = pick(1)
+        pos = pick(2)
+
+        patched = np.setdiff1d(np.union1d(ts,pos),dropped)
+        events = data[patched]
+        events["ts"][np.in1d(patched,ts)] = 0xffffffff
+        moved = np.in1d(patched,pos)
+        axis = self.axis[i,:patched.size][moved]
+        events["data"][moved] = np.where(axis,
+                                        events["data"][moved] & 0xff000fff | 0xfff000,
+                                        events["data"][moved] & 0xfffff000 | 0xfff)
+
+        frames = []
+        start = 0
+        for j in np.union1d(dropped,patched):
+            if j > start:
+                frames.append(data[start:j])
+            k = np.searchsorted(patched,j)
+            if k < patched.size and patched[k] == j:
+                frames.append(events[k:k+1])
+            start = j+1
+        if start < data.size:
+            frames.append(data[start:])
+        return frames
@@ -1,7 +1,108 @@
 import numpy as np
+import zmq
+import json
 
 event_t = np.dtype([("ts",np.uint32),
                     ("data",np.uint32)])
 
 def multiplyNEventArray(data,multiplier) :
     return np.tile(data,multiplier)
+
+def sendNEventArray(socket,data,multiplier=1,flags=0) :
+    """Sends data as the events of one pulse, repeated multiplier times.
+
+    Rather than tiling the array, the same buffer is queued as
+    multiplier zmq frames of a multipart message, so memory stays flat
+    while the bytes on the wire scale with the multiplier.
+    """
+    sendNEventFrames(socket,[data],multiplier,flags)
+
+def sendNEventFrames(socket,frames,multiplier=1,flags=0) :
+    """Same as sendNEventArray, for a pulse split over several buffers."""
+    frames = [f for f in frames if f.nbytes > 0]*int(multiplier)
+    if len(frames) == 0:
+        frames = [np.empty(0,dtype=event_t)]
+    for f in frames[:-1]:
+        socket.send(f,flags|zmq.SNDMORE,copy=f.nbytes < 65536)
+    socket.send(frames[-1],flags,copy=frames[-1].nbytes < 65536)
+
+def parseHeader(message) :
+    """Decodes a pulse header, with or without the trailing NUL the C
+    consumers need.
+    """
+    return json.loads(message.rstrip(b"\0"))
+
+def recvFrames(socket) :
+    """Receives the remaining zmq frames of a multipart message without
+    copying them.
+    """
+    frames = [socket.recv(copy=False)]
+    while frames[-1].more:
+        frames.append(socket.recv(copy=False))
+    return frames
+
+def recvNEventFrames(socket) :
+    """Receives the event frames of one pulse without copying them, as a
+    list of arrays viewing the zmq frame buffers.
+    """
+    return [np.asarray(f.buffer).view(event_t) for f in recvFrames(socket)]
+
+def recvNEventArray(socket) :
+    """Receives the event frames of one pulse as a single array."""
+    frames = recvNEventFrames(socket)
+    if len(frames) == 1:
+        return frames[0]
+    return np.concatenate(frames)
+
+
+class NEventRing:
+    """Preallocated event buffer the receivers batch pulses into.
+
+    >>> ring = NEventRing()
+    >>> frames = recvNEventFrames(socket)
+    >>> if not ring.fits(frames): process(*ring.drain())
+    >>> ring.push(header,frames)
+    >>> if ring.full(): process(*ring.drain())
+
+    drain() returns the pulse headers, the events of every pulse and all
+    the events of the batch, as views into the ring. They are only valid
+    until the next push().
+    """
+
+    def __init__(self,size=1<<22,pulses=14):
+        self.events = np.empty(size,dtype=event_t)
+        self.pulses = pulses
+        self.headers = []
+        self.bounds = [0]
+
+    def fits(self,frames):
+        return self.bounds[-1]+sum([f.size for f in frames]) <= self.events.size
+
+    def full(self):
+        return len(self.headers) >= self.pulses
+
+    def push(self,header,frames):
+        n = sum([f.size for f in frames])
+        start = self.bounds[-1]
+        if start+n > self.events.size:
+            events = np.empty(max(start+n,2*self.events.size),dtype=event_t)
+            events[:start] = self.events[:start]
+            self.events = events
+        for f in frames:
+            self.events[start:start+f.size] = f
+            start += f.size
+        self.headers.append(header)
+        self.bounds.append(start)
+
+    def drain(self):
+        bounds = self.bounds
+        pulses = [self.events[a:b] for a,b in zip(bounds[:-1],bounds[1:])]
+        batch = (self.headers,pulses,self.events[:bounds[-1]])
+        self.headers = []
+        self.bounds = [0]
+        return batch
+
+
+def writeNEventText(of,data) :
+    """Writes one "(ts, data)" line per event."""
+    np.savetxt(of,np.column_stack((data["ts"],data["data"])),fmt="(%d, %d)")
@@ -4,16 +4,37 @@ import errno
 
 import numpy as np
 
-import nxs
+try:
+    import nxs
+except ImportError:
+    nxs = None
 import neventarray
 import time
 
+def expandHistogram(data):
+    """Returns, for each axis of the histogram, the bin index of every
+    counted event. Events come out in C order of data, the same order a
+    nested loop over all bins would produce them in.
+    """
+    data = np.asarray(data)
+    nonzero = np.flatnonzero(data > 0)
+    counts = data.ravel()[nonzero]
+    return [np.repeat(i, counts) for i in np.unravel_index(nonzero, data.shape)]
+
+
+def tofBins(tof):
+    """Per-bin event timestamps, rounded the same way as a Python loop would."""
+    return np.array([round(t/10.) for t in tof], dtype=np.uint32)
+
+
+def position(x, y):
+    return np.left_shift(y.astype(np.uint32), 12) | x.astype(np.uint32)
+
+
 def loadAMOR(source) :
     f = nxs.open(source,'r')
 
     f.openpath("entry1/AMOR/area_detector/data")
-    dim,datatype= f.getinfo()
-    size = np.prod(dim)
     data = f.getdata()
     f.close()
 
@@ -22,28 +43,17 @@ def loadAMOR(source) :
     tof = f.getdata()
     f.close()
 
-    nEvents = np.sum(data)
-    signal = np.empty(nEvents,dtype=neventarray.event_t)
+    return expandAMOR(data,tof)
 
-    nEv = 0
-    detID = 0
-    for row in range(dim[0]):
-        for col in range(dim[1]):
-            for it in range(dim[2]):
-                events = data[row][col][it]
-                if events > 0:
-                    signal[nEv:nEv+events]["ts"] = round(tof[it]/10.)
-                    signal[nEv:nEv+events]["x"] = row
-                    signal[nEv:nEv+events]["y"] = col
-                    nEv = nEv+events
-
-    if not signal.shape[0] == nEv:
-        raise Exception("Error in reading NeXus data: wrong number of events",nEv)
-
-    return signal
 
+def expandAMOR(data,tof):
+    row, col, it = expandHistogram(data)
 
+    signal = np.zeros(row.size,dtype=neventarray.event_t)
+    signal["ts"] = tofBins(tof)[it]
+    signal["data"] = position(row,col)
 
+    return signal
 
 
 
@@ -52,31 +62,17 @@ def loadFOCUS(source) :
     f = nxs.open(source,'r')
 
     f.openpath("entry1/FOCUS/merged/counts")
-    dim,datatype= f.getinfo()
-    size = np.prod(dim)
     data = f.getdata()
     f.close()
 
-    f = nxs.open(source,'r')
-    f.openpath("entry1/FOCUS/merged/time_binning")
-    tof = f.getdata()
-    f.close()
+    return expandFOCUS(data)
 
-    nEvents = np.sum(data)
-    signal = np.empty(nEvents,dtype=neventarray.event_t)
 
-    nEv = 0
-    detID = 0
-    for row in range(dim[0]):
-        for it in range(dim[1]):
-            events = data[row][it]
-            if events > 0:
-                signal[nEv:nEv+events]["x"] = row
-                signal[nEv:nEv+events]["y"] = it
-                nEv = nEv+events
+def expandFOCUS(data):
+    row, it = expandHistogram(data)
 
-    if not signal.shape[0] == nEv:
-        raise Exception("Error in reading NeXus data: wrong number of events",nEv)
+    signal = np.zeros(row.size,dtype=neventarray.event_t)
+    signal["data"] = position(row,it)
 
     return signal
 ##########################
@@ -87,44 +83,44 @@ def loadRITA2(source) :
     f = nxs.open(source,'r')
 
     f.openpath("entry1/RITA-2/detector/counts")
-    dim,datatype= f.getinfo()
-    size = np.prod(dim)
     data = f.getdata()
     f.close()
 
-    np.random.seed(1234)
-    timestamp = np.sort(np.random.randint(2**32-1,size=dim[0]))
-
-    nEvents = np.sum(data)
+    m = np.sum(data,0)
+    np.savetxt('orig.out',m,delimiter=' ')
 
-    signal = np.empty(nEvents,dtype=neventarray.event_t)
+    return expandRITA2(data)
 
-    nEv = 0
-    detID = 0
 
-    row = np.uint16
-    col = np.uint16
+def expandRITA2(data):
+    dim = np.shape(data)
 
-    m = np.sum(data,0)
-    np.savetxt('orig.out',m,delimiter=' ')
+    np.random.seed(1234)
+    timestamp = np.sort(np.random.randint(2**32-1,size=dim[0]))
 
-    for row in range(dim[1]):
-        for col in range(dim[2]):
-            for it in range(dim[0]):
-                events = data[it][row][col]
-                if events > 0:
-                    signal[nEv:nEv+events]["ts"] = timestamp[it]
-                    signal[nEv:nEv+events]["data"] = (0 << 31 | 0 << 30 | 1 << 29 | 1 << 28 | 2 << 24 | col << 12 | row ) 
-                    nEv = nEv+events
+    row, col, it = expandHistogram(np.transpose(data,(1,2,0)))
 
+    signal = np.zeros(row.size,dtype=neventarray.event_t)
+    signal["ts"] = timestamp[it]
+    signal["data"] = (0 << 31 | 0 << 30 | 1 << 29 | 1 << 28 | 2 << 24) | position(row,col)
 
     return signal
 
 
+headerTemplate = ('{"htype":"sinq-1.0","pid":%s,"st":%r,"ts":%s,"tr":100000,'
+                  '"ds":[{"ts":32,"bsy":1,"cnt":1,"rok":1,"gat":1,"evt":4,"id1":12,"id0":12},%s],'
+                  '"hws":{"error":0,"overflow":0,"zmqerr":0,"lost":[0,1,2,3,4,5,6,7,8,9]}}\0')
+
 def header(pulseID=1234,st=time.time(),ts=np.random.randint(3200000000),ne=0):
-    dataHeader = '{"htype\":"sinq-1.0","pid":'+str(pulseID)+',st":'+str(st)+',"ts":'+str(ts)+',"tr":100000,"ds":[{"ts":32,"bsy":1,"cnt":1,"rok":1,"gat":1,"evt":4,"id1":12,"id0":12},'+str(ne)+'],"hws":{"error":0,"overflow":0,"zmqerr":0,"lost":[0,1,2,3,4,5,6,7,8,9]}}\0'
+    return headerTemplate % (pulseID,st,ts,ne)
 
-    return dataHeader
+
+def detectorType(source):
+    for detector in ("amor","rita","focus"):
+        if detector in source:
+            return detector
+
+    raise NotImplementedError("Detector not implemented")
 
 
 def loadNeXus2event(source):
@@ -132,13 +128,18 @@ def loadNeXus2event(source):
     if not os.path.isfile(source) :
         raise IOError
 
+    if nxs is None:
+        raise ImportError("the nxs NeXus bindings are needed to load "+source)
+
+    detector = detectorType(source)
+
     print "Loading from file " + source
-    if "amor" in source:
+    if detector == "amor":
         return loadAMOR(source)
-    if "rita" in source:
+    if detector == "rita":
         return loadRITA2(source)
-
-    raise NotImplementedError("Detector not implemented")
+    if detector == "focus":
+        return loadFOCUS(source)
 
 
 
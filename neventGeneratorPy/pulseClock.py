@@ -0,0 +1,136 @@
+import time
+import bisect
+
+try:
+    from time import monotonic
+except ImportError:
+    import os
+    import ctypes
+
+    class timespec(ctypes.Structure):
+        _fields_ = [("tv_sec",ctypes.c_long),
+                    ("tv_nsec",ctypes.c_long)]
+
+    CLOCK_MONOTONIC = 1
+
+    try:
+        clock_gettime = ctypes.CDLL(None,use_errno=True).clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int,ctypes.POINTER(timespec)]
+
+        def monotonic():
+            t = timespec()
+            if clock_gettime(CLOCK_MONOTONIC,ctypes.byref(t)) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno,os.strerror(errno))
+            return t.tv_sec+t.tv_nsec*1e-9
+    except AttributeError:
+        monotonic = time.time
+
+
+class LatenessHistogram:
+    """Histogram of how late each pulse was sent with respect to its
+    deadline. Bin edges are in seconds.
+    """
+
+    edges = [10e-6,50e-6,100e-6,500e-6,1e-3,5e-3,10e-3,50e-3,100e-3]
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0]*(len(self.edges)+1)
+        self.max = 0.
+
+    def record(self,late):
+        self.counts[bisect.bisect(self.edges,late)] += 1
+        self.max = max(self.max,late)
+
+    def __str__(self):
+        labels = ["<"+self.label(e) for e in self.edges]+[">="+self.label(self.edges[-1])]
+        return (" ".join([l+":"+str(c) for l,c in zip(labels,self.counts)])+
+                " max:"+self.label(self.max))
+
+    def label(self,t):
+        if t < 1e-3:
+            return str(int(round(t*1e6)))+"us"
+        return str(int(round(t*1e3)))+"ms"
+
+
+class PulseClock:
+    """Paces pulses on absolute deadlines of a monotonic clock.
+
+    >>> clock = PulseClock(14)
+    >>> while True:
+    ...     pulseID = clock.wait()
+    ...     send(pulseID)
+
+    Args:
+    rate     (float): pulses per second
+    spin     (float): the last spin seconds before a deadline are busy
+                      waited instead of slept, for sub-ms precision
+    catchup  (str):   what to do after an overrun longer than one period:
+                      "burst" sends the missed pulses back to back (at most
+                      maxburst of them), "skip" drops them and keeps the
+                      pulse ID in step with the time, "rebase" restarts the
+                      schedule from now
+    """
+
+    policies = ("burst","skip","rebase")
+
+    def __init__(self,rate=14.,spin=0.,catchup="skip",maxburst=14):
+        if catchup not in self.policies:
+            raise ValueError("Unknown catch-up policy",catchup)
+        self.spin = spin
+        self.catchup = catchup
+        self.maxburst = maxburst
+        self.pulse = 0
+        self.rate = None
+        self.deadline = monotonic()
+        self.histogram = LatenessHistogram()
+        self.setRate(rate)
+
+    def setRate(self,rate):
+        if rate != self.rate:
+            self.rate = rate
+            self.period = 1./rate
+
+    def delay(self):
+        """Seconds left until the deadline of the next pulse."""
+        return self.deadline-monotonic()
+
+    def wait(self):
+        """Blocks until the deadline of the next pulse and returns its ID."""
+        remaining = self.deadline-monotonic()
+        if remaining > self.spin:
+            time.sleep(remaining-self.spin)
+        while monotonic() < self.deadline:
+            pass
+
+        return self.tick()
+
+    def tick(self):
+        """Returns the ID of the pulse that is due and moves on to the next
+        deadline. For callers that schedule themselves on delay(), such as
+        the Twisted reactor.
+        """
+        now = monotonic()
+        late = now-self.deadline
+        self.histogram.record(late)
+
+        pulse = self.pulse
+        self.pulse += 1
+        self.deadline += self.period
+
+        missed = int(late/self.period)
+        if missed > 0:
+            if self.catchup == "skip":
+                self.pulse += missed
+                self.deadline += missed*self.period
+            elif self.catchup == "burst":
+                if missed > self.maxburst:
+                    self.pulse += missed-self.maxburst
+                    self.deadline += (missed-self.maxburst)*self.period
+            else:
+                self.deadline = now+self.period
+
+        return pulse
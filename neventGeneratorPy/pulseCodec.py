@@ -0,0 +1,182 @@
+import time
+import zlib
+
+import numpy as np
+
+from neventarray import event_t
+
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+compressors = ("zlib","lz4","zstd")
+
+def available():
+    """Names of the codecs that can be used with the installed modules."""
+    names = ["none","delta"]
+    for c,module in zip(compressors,(zlib,lz4,zstd)):
+        if module is not None:
+            names += [c,"delta+"+c]
+    return names
+
+
+def deltaEncode(data):
+    """Columnar layout of the events with the timestamps delta encoded:
+    an 8 bytes prelude (delta width in bytes, number of events), the
+    deltas in the narrowest unsigned type that holds them all and the
+    data words. Only time ordered pulses get narrower, but the columns
+    compress better in any case.
+    """
+    ts = data["ts"]
+    delta = np.empty(ts.size,dtype=np.uint32)
+    delta[:1] = ts[:1]
+    np.subtract(ts[1:],ts[:-1],out=delta[1:])
+    top = delta.max() if delta.size > 0 else 0
+    for dtype in (np.uint8,np.uint16,np.uint32):
+        if top <= np.iinfo(dtype).max:
+            break
+    prelude = np.array([np.dtype(dtype).itemsize,ts.size],dtype=np.uint32)
+    return prelude.tobytes()+delta.astype(dtype).tobytes()+data["data"].tobytes()
+
+
+def deltaDecode(buf):
+    width,n = np.frombuffer(buf,dtype=np.uint32,count=2)
+    dtype = {1:np.uint8,2:np.uint16,4:np.uint32}[int(width)]
+    data = np.empty(n,dtype=event_t)
+    data["ts"] = np.cumsum(np.frombuffer(buf,dtype=dtype,count=n,offset=8),dtype=np.uint32)
+    data["data"] = np.frombuffer(buf,dtype=np.uint32,count=n,offset=8+n*width)
+    return data
+
+
+class PulseCodec:
+    """Per-pulse compression of the event payload.
+
+    Args:
+    method (str): "none", "delta", one of zlib, lz4 and zstd, or
+                  "delta+<compressor>" to compress the delta layout
+    level  (int): compression level, by default the fastest one
+
+    The method goes into the "cmp" field of the pulse header, from which
+    decodeFrames() picks the codec on the receiving side. Payloads that
+    are sent again and again can be encoded once with precompute().
+    Time spent and bytes before and after encoding are accounted and
+    returned by stats().
+    """
+
+    def __init__(self,method="none",level=None):
+        parts = [p for p in method.split("+") if p not in ("","none")]
+        self.delta = "delta" in parts
+        parts = [p for p in parts if p != "delta"]
+        if len(parts) > 1 or (parts and parts[0] not in compressors):
+            raise ValueError("Unknown compression",method)
+        self.compressor = parts[0] if parts else None
+        if (self.compressor == "lz4" and lz4 is None) or (self.compressor == "zstd" and zstd is None):
+            raise ImportError("the "+self.compressor+" module is not installed")
+
+        self.name = "+".join(["delta"]*self.delta+parts) or "none"
+        self.level = level
+        if self.compressor == "zstd":
+            self.zcompress = zstd.ZstdCompressor(level=level or 1).compress
+            self.zdecompress = zstd.ZstdDecompressor().decompress
+        self.static = {}
+        self.resetStats()
+
+    def resetStats(self):
+        self.raw = 0
+        self.encoded = 0
+        self.seconds = 0.
+
+    def stats(self):
+        """Returns and resets the raw and encoded bytes and the seconds
+        spent encoding them.
+        """
+        s = {"raw":self.raw,"encoded":self.encoded,"seconds":self.seconds,
+             "ratio":self.raw/float(max(self.encoded,1))}
+        self.resetStats()
+        return s
+
+    def compress(self,buf):
+        if self.compressor == "zlib":
+            return zlib.compress(buf,1 if self.level is None else self.level)
+        if self.compressor == "lz4":
+            return lz4.compress(buf,compression_level=self.level or 0)
+        return self.zcompress(buf)
+
+    def decompress(self,buf):
+        if self.compressor == "zlib":
+            return zlib.decompress(buf)
+        if self.compressor == "lz4":
+            return lz4.decompress(buf)
+        return self.zdecompress(buf)
+
+    def encode(self,data):
+        """Returns the encoded events as an array of bytes, to be sent as
+        one frame.
+        """
+        if self.name == "none":
+            return data
+        start = time.time()
+        buf = deltaEncode(data) if self.delta else data.tobytes()
+        if self.compressor is not None:
+            buf = self.compress(buf)
+        self.seconds += time.time()-start
+        return np.frombuffer(buf,dtype=np.uint8)
+
+    def decode(self,buf):
+        if self.compressor is not None:
+            buf = self.decompress(buf)
+        if self.delta:
+            return deltaDecode(buf)
+        return np.frombuffer(buf,dtype=event_t)
+
+    def precompute(self,pulses):
+        """Encodes the static pulses once; encodeFrames() of one of these
+        very arrays then reuses the result. The arrays are kept referenced,
+        so their id stays unique.
+        """
+        if self.name == "none":
+            return
+        for p in pulses:
+            self.static[id(p)] = (p,self.encode(p))
+
+    def encodeFrames(self,frames):
+        """Encodes the events of a pulse split over frames, returning the
+        list of frames to send.
+        """
+        if self.name != "none":
+            if len(frames) == 1 and id(frames[0]) in self.static:
+                encoded = self.static[id(frames[0])][1]
+            else:
+                data = frames[0] if len(frames) == 1 else np.concatenate(frames)
+                encoded = self.encode(data)
+            self.raw += sum([f.nbytes for f in frames])
+            self.encoded += encoded.nbytes
+            frames = [encoded]
+        return frames
+
+    def tagHeader(self,header):
+        """Adds the "cmp" field to a pulse header."""
+        if self.name == "none":
+            return header
+        end = header.rindex("}")
+        return header[:end]+',"cmp":"'+self.name+'"'+header[end:]
+
+
+decoders = {}
+
+def decodeFrames(header,frames):
+    """Decodes the zmq frames of a pulse with the codec of its header."""
+    name = "none"
+    if isinstance(header,dict):
+        name = header.get("cmp","none")
+    if name == "none":
+        return [np.asarray(f.buffer).view(event_t) for f in frames]
+    if name not in decoders:
+        decoders[name] = PulseCodec(name)
+    return [decoders[name].decode(f.bytes) for f in frames]
@@ -0,0 +1,64 @@
+import threading
+import Queue
+
+class PulseFanOut:
+    """Shards pulses across several sockets, each with its own sender thread.
+
+    The caller keeps generating the pulse ID sequence (typically from a
+    PulseClock) and hands every pulse to put(); the first idle sender
+    thread sends it through send(socket,*pulse), which must return the
+    number of bytes sent. Statistics are kept per sender and summed by
+    stats(). put() blocks once every sender is busy and backlog pulses
+    are queued, so an overloaded fan-out shows up as pulse lateness
+    rather than unbounded memory. A pulse whose send() raises is printed
+    and dropped; the sender goes on with the next one, so put() and
+    stop() never wait for a dead sender.
+    """
+
+    def __init__(self,sockets,send,backlog=2):
+        self.sockets = sockets
+        self.send = send
+        self.queue = Queue.Queue(maxsize=backlog*len(sockets))
+        self.counts = [0]*len(sockets)
+        self.sizes = [0]*len(sockets)
+        # the senders add to the statistics while stats() swaps them
+        self.lock = threading.Lock()
+        self.threads = []
+        for i in range(len(sockets)):
+            thread = threading.Thread(target=self.sender,args=(i,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def sender(self,i):
+        socket = self.sockets[i]
+        while True:
+            pulse = self.queue.get()
+            if pulse is None:
+                break
+            try:
+                size = self.send(socket,*pulse)
+            except Exception as e:
+                print "Sender",i,"failed to send a pulse:",e
+                continue
+            with self.lock:
+                self.sizes[i] += size
+                self.counts[i] += 1
+
+    def put(self,*pulse):
+        self.queue.put(pulse)
+
+    def stats(self):
+        """Returns and resets the number of pulses and bytes sent by all
+        senders together.
+        """
+        with self.lock:
+            counts,self.counts = self.counts,[0]*len(self.sockets)
+            sizes,self.sizes = self.sizes,[0]*len(self.sockets)
+        return sum(counts),sum(sizes)
+
+    def stop(self):
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
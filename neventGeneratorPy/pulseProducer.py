@@ -0,0 +1,78 @@
+import time
+
+import zmq
+from twisted.internet import reactor
+
+from pulseClock import PulseClock
+
+class PulseProducer:
+    """Sends pulses from the Twisted reactor instead of a thread.
+
+    Every deadline of a PulseClock, send(socket,pulseID,flags) is called
+    in the reactor thread; it returns the number of bytes sent, or None
+    if it had nothing to send (e.g. paused). The first frame of every
+    pulse must be sent with flags, which carries zmq.NOBLOCK: when the
+    consumers are slow and the socket is at its SNDHWM the pulse is
+    dropped and counted rather than blocking the reactor; any other zmq
+    error stops the producer. Since the producer is the only sender on
+    its socket and never runs twice, the controller state it reads needs
+    no locking.
+    """
+
+    def __init__(self,socket,send,rate=14.,interval=10.,clock=reactor):
+        self.socket = socket
+        self.send = send
+        self.rate = rate
+        self.interval = interval
+        self.reactor = clock
+        self.call = None
+        self.pulses = None
+        self.resetStats()
+
+    def resetStats(self):
+        self.sent = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.ctime = time.time()
+
+    def running(self):
+        return self.call is not None
+
+    def start(self):
+        if self.call is not None:
+            return False
+        self.pulses = PulseClock(self.rate)
+        self.resetStats()
+        self.call = self.reactor.callLater(0,self.fire)
+        return True
+
+    def stop(self):
+        if self.call is not None and self.call.active():
+            self.call.cancel()
+        self.call = None
+
+    def fire(self):
+        pulseID = self.pulses.tick()
+        try:
+            size = self.send(self.socket,pulseID,zmq.NOBLOCK)
+            if size is not None:
+                self.sent += 1
+                self.bytes += size
+        except zmq.Again:
+            self.dropped += 1
+        except zmq.ZMQError as e:
+            print "Stopping the pulses, sending failed:",e
+            self.call = None
+            return
+
+        if time.time()-self.ctime > self.interval:
+            self.report()
+
+        self.call = self.reactor.callLater(max(self.pulses.delay(),0.),self.fire)
+
+    def report(self):
+        elapsed = time.time()-self.ctime
+        print "Sent ",self.sent," pulses @ ",self.bytes/(elapsed*1e6)," MB/s, dropped at HWM ",self.dropped
+        print "Lateness ",self.pulses.histogram
+        self.pulses.histogram.reset()
+        self.resetStats()
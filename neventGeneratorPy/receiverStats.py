@@ -0,0 +1,116 @@
+import time
+
+import numpy as np
+
+from pulseClock import monotonic
+
+class ReceiverStats:
+    """Loss, latency and jitter accounting of the received pulses.
+
+    Gaps and reordering are found from the pulse ID (pid), the end-to-end
+    latency from the send time (st) in the header, which assumes sender
+    and receiver clocks are synchronised. Latency and inter-arrival times
+    of the last window pulses are kept for the percentiles. A missing
+    pulse arriving after a later one counts as reordered, not lost, a
+    pulse which was already received as duplicated. A pid more than
+    restart pulses behind the last one is taken as a restart of the
+    generator rather than a reordered pulse.
+    """
+
+    def __init__(self,window=10000,restart=1000):
+        self.window = window
+        self.restart = restart
+        self.reset()
+
+    def reset(self):
+        self.started = monotonic()
+        self.pulses = 0
+        self.bytes = 0
+        self.events = 0
+        self.lost = 0
+        self.reordered = 0
+        self.duplicated = 0
+        self.restarts = 0
+        self.lastPid = None
+        self.missing = set()
+        self.lastArrival = None
+        self.latency = np.empty(self.window)
+        self.interarrival = np.empty(self.window)
+        self.nLatency = 0
+        self.nInterarrival = 0
+
+    def record(self,header,nbytes,nevents=0):
+        now = time.time()
+        arrival = monotonic()
+
+        self.pulses += 1
+        self.bytes += nbytes
+        self.events += nevents
+
+        if self.lastArrival is not None:
+            self.interarrival[self.nInterarrival % self.window] = arrival-self.lastArrival
+            self.nInterarrival += 1
+        self.lastArrival = arrival
+
+        if not isinstance(header,dict):
+            return
+
+        if "st" in header:
+            self.latency[self.nLatency % self.window] = now-float(header["st"])
+            self.nLatency += 1
+
+        if "pid" in header:
+            pid = int(header["pid"])
+            if self.lastPid is None or pid > self.lastPid:
+                if self.lastPid is not None and pid > self.lastPid+1:
+                    self.lost += pid-self.lastPid-1
+                    # only the pids which can still arrive as reordered
+                    oldest = pid-self.restart
+                    self.missing = set(p for p in self.missing if p >= oldest)
+                    self.missing.update(xrange(max(self.lastPid+1,oldest),pid))
+                self.lastPid = pid
+            elif self.lastPid-pid > self.restart:
+                self.restarts += 1
+                self.lastPid = pid
+                self.missing = set()
+            elif pid in self.missing:
+                self.missing.discard(pid)
+                self.reordered += 1
+                self.lost -= 1
+            else:
+                self.duplicated += 1
+
+    def percentiles(self,samples,n):
+        samples = samples[:min(n,self.window)]
+        if samples.size == 0:
+            return [0.,0.,0.]
+        return list(np.percentile(samples,[50,99]))+[samples.max()]
+
+    def summary(self):
+        elapsed = max(monotonic()-self.started,1e-9)
+        interarrival = self.interarrival[:min(self.nInterarrival,self.window)]
+        if interarrival.size > 0:
+            jitter = np.abs(interarrival-np.median(interarrival))
+        else:
+            jitter = interarrival
+        return {"pulses":self.pulses,
+                "events":self.events,
+                "bytes":self.bytes,
+                "elapsed":elapsed,
+                "bandwidth":self.bytes/elapsed,
+                "lost":self.lost,
+                "reordered":self.reordered,
+                "duplicated":self.duplicated,
+                "restarts":self.restarts,
+                "latency":self.percentiles(self.latency,self.nLatency),
+                "interarrival":self.percentiles(interarrival,interarrival.size),
+                "jitter":self.percentiles(jitter,jitter.size)}
+
+    def __str__(self):
+        s = self.summary()
+        ms = lambda v: "/".join(["%.3f" % (1e3*t) for t in v])
+        return ("pulses %d events %d bytes %d (%.3f MB/s) lost %d reordered %d restarts %d "
+                "duplicated %d latency p50/p99/max %s ms interarrival %s ms jitter %s ms" %
+                (s["pulses"],s["events"],s["bytes"],s["bandwidth"]/1e6,
+                 s["lost"],s["reordered"],s["restarts"],s["duplicated"],
+                 ms(s["latency"]),ms(s["interarrival"]),ms(s["jitter"])))
@@ -5,24 +5,66 @@ import time
 import json
 import numpy as np
 
+class FileWatch:
+    """Keeps the parsed content of a file, re-reading it only when its
+    mtime changes. The mtime is checked at most once per interval seconds;
+    a file caught half-written keeps the previous content until the next
+    check.
+    """
+
+    def __init__(self,path,load,interval=1.):
+        self.path = path
+        self.load = load
+        self.interval = interval
+        self.checked = 0.
+        self.mtime = None
+        self.value = None
+
+    def get(self):
+        now = time.time()
+        if now-self.checked < self.interval:
+            return self.value
+        self.checked = now
+
+        mtime = os.stat(self.path).st_mtime
+        if mtime != self.mtime:
+            try:
+                with open(self.path) as i:
+                    self.value = self.load(i)
+                self.mtime = mtime
+            except ValueError:
+                if self.value is None:
+                    raise
+        return self.value
+
+
+fields = {"pid":"%(pid)d","st":"%(st)r","ts":"%(ts)d","ne":"%(ne)d"}
+
+def compileTemplate(i):
+    """Turns header.in into a format string in which only pid, st, ts
+    and the number of events are left to fill in.
+    """
+    h = json.load(i)
+
+    h["pid"]   = "@@pid@@"
+    h["st"]    = "@@st@@"
+    h["ts"]    = "@@ts@@"
+    h["ds"][1] = "@@ne@@"
+
+    template = json.dumps(h).replace("%","%%")
+    for k,v in fields.items():
+        template = template.replace('"@@'+k+'@@"',v)
+    return template
+
+headerTemplate = FileWatch("header.in",compileTemplate)
+controlWatch = FileWatch("control.in",json.load)
+
 def header(pid=1234,st=time.time(),ts=np.random.randint(3200000000),ne=0):
-    with open("header.in") as i:
-        h = json.load(i)
-    i.close()
-
-    h["pid"]   = pid
-    h["st"]    = st
-    h["ts"]    = ts
-    h["ds"][1] = ne
-    
-    return json.dumps(h)
-    
+    return headerTemplate.get() % {"pid":pid,"st":st,"ts":ts,"ne":ne}
+
 
 def control():
-    with open("control.in") as i:
-        ctl = json.load(i)
-    i.close()
-    return ctl
+    return controlWatch.get()
 
 def set_ds(d,ctl):
     for i in d:
@@ -0,0 +1,87 @@
+import numpy as np
+
+import neventarray
+from nexus2event import position
+
+layouts = ("uniform","spot","detector")
+profiles = ("moderator","uniform")
+
+def uniformPositions(rng,n,nx,ny):
+    return rng.randint(nx,size=n),rng.randint(ny,size=n)
+
+
+def spotPositions(rng,n,nx,ny,cx,cy,sigma):
+    x = np.clip(np.rint(rng.normal(cx,sigma,n)),0,nx-1)
+    y = np.clip(np.rint(rng.normal(cy,sigma,n)),0,ny-1)
+    return x.astype(np.uint32),y.astype(np.uint32)
+
+
+def detectorPositions(rng,n,nx,ny,npeaks=8,background=.3):
+    """A few Bragg peaks of different width and intensity on a flat
+    background, the same peaks for all pulses.
+    """
+    cx = rng.uniform(.1,.9,npeaks)*nx
+    cy = rng.uniform(.1,.9,npeaks)*ny
+    sigma = rng.uniform(.005,.02,npeaks)*min(nx,ny)
+    weight = rng.exponential(size=npeaks)
+
+    nbackground = rng.binomial(n,background)
+    npeak = rng.multinomial(n-nbackground,weight/weight.sum())
+
+    x,y = uniformPositions(rng,nbackground,nx,ny)
+    xs = [x.astype(np.uint32)]
+    ys = [y.astype(np.uint32)]
+    for i in range(npeaks):
+        x,y = spotPositions(rng,npeak[i],nx,ny,cx[i],cy[i],sigma[i])
+        xs.append(x)
+        ys.append(y)
+    return np.concatenate(xs),np.concatenate(ys)
+
+
+def timeOfFlight(rng,n,tofmax,profile="moderator"):
+    """Event timestamps from 0 to tofmax. The moderator profile has the
+    time of flight of a Maxwellian spectrum: the energy is gamma
+    distributed and the time of flight proportional to 1/sqrt(E), peaking
+    at about tofmax/6. Neutrons slower than the frame overlap into it.
+    """
+    if profile == "uniform":
+        return rng.randint(tofmax,size=n).astype(np.uint32)
+    tof = .25*tofmax/np.sqrt(rng.gamma(2.,size=n))
+    return np.mod(tof,tofmax).astype(np.uint32)
+
+
+def syntheticEvents(nevents=10000,npulses=16,layout="detector",profile="moderator",
+                    nx=1024,ny=1024,tofmax=100000,seed=None):
+    """Returns a pool of npulses distinct pulses of nevents events each,
+    as an (npulses, nevents) array of event_t: every row is a pulse with
+    events in time order, so that consecutive pulses are not byte
+    identical. Positions are packed into the data word like the NeXus
+    loaders do.
+
+    Args:
+    layout  (str): "uniform" over the detector, "spot" a gaussian spot in
+                   its centre, "detector" peaks on a background
+    profile (str): time of flight profile, "moderator" or "uniform"
+    seed    (int): the same seed always gives the same pool
+    """
+    if layout not in layouts:
+        raise ValueError("Unknown layout",layout)
+    if profile not in profiles:
+        raise ValueError("Unknown time of flight profile",profile)
+
+    rng = np.random.RandomState(seed)
+    n = nevents*npulses
+
+    if layout == "uniform":
+        x,y = uniformPositions(rng,n,nx,ny)
+    elif layout == "spot":
+        x,y = spotPositions(rng,n,nx,ny,nx/2.,ny/2.,min(nx,ny)/20.)
+    else:
+        x,y = detectorPositions(rng,n,nx,ny)
+        order = rng.permutation(n)
+        x,y = x[order],y[order]
+
+    events = np.empty((npulses,nevents),dtype=neventarray.event_t)
+    events["ts"] = np.sort(timeOfFlight(rng,n,tofmax,profile).reshape(npulses,nevents),axis=1)
+    events["data"] = position(x,y).reshape(npulses,nevents)
+    return events
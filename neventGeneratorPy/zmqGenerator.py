@@ -1,5 +1,6 @@
 from nexus2event import *
 from neventarray import *
+from eventCache import loadCachedNeXus2event
 
 import sys, os, getopt
 import errno
@@ -12,122 +13,175 @@ import twisted
 from twisted.internet.defer import inlineCallbacks
 
 import ritaHeader as rh
+from pulseClock import PulseClock
+from pulseFanOut import PulseFanOut
+from faultInjection import FaultInjector
+from syntheticEvents import syntheticEvents, layouts
+from pulseCodec import PulseCodec, available
+from eventReplay import replayPulses, ReplayClock
 
 def usage() :
     print ""
     print "Usage:"
-    print "\tpython",sys.argv[0],"[-h] <nexus file> <port> (<multiplier>)"
+    print "\tpython",sys.argv[0],"[-h -s <n> -m -e <n> -l <layout> -c <codec> -R <speed>] <nexus file> <port> (<multiplier>)"
     print ""
     print "-h: this help"
+    print "-m: send synthetic data instead of the NeXus file"
+    print "-e: synthetic events per pulse (default 10000)"
+    print "-l: synthetic layout, one of",", ".join(layouts),"(default detector)"
+    print "-c: compress the pulses, one of",", ".join(available()),"(default none)"
+    print "-R: replay the events of the file in time order, <speed> times faster than"
+    print "    recorded or as fast as possible with max: a NeXus event file, a .npy"
+    print "    time ordered event list or a .bin recording of el737counter_recv"
+    print "-s, -t: shard pulses over <n> sockets bound to ports <port>..<port>+<n>-1,"
+    print "        each with its own sender thread (default 1)"
     print ""
 
 
 
 class generatorSource:
 
-    def __init__ (self,source,port,multiplier):
+    def __init__ (self,source,port,multiplier,nsockets=1,mock=False,nevents=10000,layout="detector",
+                  compression="none",speed=None):
         print rh.header()
         self.source = source
+        self.codec = PulseCodec(compression)
+        self.speed = speed
+        self.mock = mock
+        self.nevents = nevents
+        self.layout = layout
         self.port = port
-        self.context = zmq.Context()
-        self.socket = self.connect()
+        self.context = zmq.Context(io_threads=nsockets)
+        self.sockets = [self.connect(int(port)+i) for i in range(nsockets)]
 #        self.data = self.load(multiplier)
+        self.multiplier = int(multiplier)
         self.count = 0
-        self.run(self.load(multiplier))
+        if speed is None:
+            self.run(self.load())
+        else:
+            self.run(None)
 
-    def connect(self):
+    def connect(self,port):
         zmq_socket = self.context.socket(zmq.PUSH)
-        zmq_socket.bind("tcp://*:"+self.port)
+        zmq_socket.bind("tcp://*:"+str(port))
         zmq_socket.setsockopt(zmq.SNDHWM, 100)
         return zmq_socket
 
-    def load(self,multiplier):
-        data = loadNeXus2event(self.source)
-        if multiplier > 1:
-            data = multiplyNEventArray(data,int(multiplier))
-        return data
-
-    def mutation(self,ctl,d):
-        o = d
-        if (ctl['mutation'] == 'nev') or (ctl['mutation'] == 'all'):
-            if  np.random.rand() > .99 :
-                o = np.delete(o,np.random.rand(o.size))
-                print "Error: missing value"
-
-        if (ctl['mutation'] == 'ts') or (ctl['mutation'] == 'all'):
-            if  np.random.rand() > .99 :
-                o[1]['ts'] = -1
-                print "Error: wrong timestamp"
-
-        if (ctl['mutation'] == 'pos') or (ctl['mutation'] == 'all'):
-            if  np.random.rand() > .99 :
-                x=np.random.randint(o.size,size=np.random.randint(5)) 
-                o[1]["data"] = o[1]["data"] & 0xff000fff | 16773120
-                print "Error: wrong position"
-            if  np.random.rand() > .99 :
-                x=np.random.randint(o.size,size=np.random.randint(5)) 
-                o[2]["data"] = o[2]["data"] & 0xfffff000 | 4095
-                print "Error: wrong position"
-
-        return o
+    def load(self):
+        if self.mock:
+            return syntheticEvents(self.nevents,layout=self.layout,seed=0)
+        return loadCachedNeXus2event(self.source)
+
+    def mutation(self,ctl,dataHeader,data):
+        self.injector.configure(ctl.get("mutation","none"),ctl.get("mutation_rate",.01))
+        return self.injector.apply(dataHeader,data)
+
+    def encode(self,messages):
+        return [(self.codec.tagHeader(h),self.codec.encodeFrames(f)) for h,f in messages]
 
     
+    def static(self,data,clock):
+        """Sends the same pulses again and again at the rate of control.in."""
+        pool = list(numpy.atleast_2d(data))
+        self.codec.precompute(pool)
+
+        ctl = rh.control()
+        nevents = pool[0].shape[0]*self.multiplier
+        s = 1e-6*(pool[0].nbytes*self.multiplier+len(rh.header(0,time.time(),12345678,nevents)))
+        print "size = ",s, "MB; expected bw = ",s * ctl["rate"], "MB/s"
+
+        while True:
+            clock.setRate(rh.control()["rate"])
+            pulseID = clock.wait()
+            yield pulseID,12345678,pool[pulseID % len(pool)]
+
+    def replay(self,clock):
+        """Sends the pulses of the file in time order, paced by clock. The
+        ts of the header is the time of the pulse in units of 100 ns.
+        """
+        for pulseID,(t,data) in enumerate(replayPulses(self.source)):
+            clock.wait(t)
+            yield pulseID,int(t*1e7) & 0xffffffff,data
+
     def run(self,data):
 
         ctl = rh.control()
+        if self.speed is None:
+            clock = PulseClock(ctl["rate"],ctl.get("spin",0.),ctl.get("catchup","skip"))
+            pulses = self.static(data,clock)
+        else:
+            clock = ReplayClock(self.speed)
+            pulses = self.replay(clock)
 
         ctime=time.time()
-        pulseID=0
+        self.injector = FaultInjector()
+
+        def send_data(socket,messages):
+            size = 0
+            for dataHeader,frames in messages:
+                if frames is not None:
+                    socket.send(dataHeader,zmq.SNDMORE)
+                    sendNEventFrames(socket,frames,self.multiplier)
+#                    socket.send(data)
+                    size += len(dataHeader)+sum([f.nbytes for f in frames])*self.multiplier
+                else:
+                    socket.send(dataHeader)
+                    size += len(dataHeader)
+            return size
 
-        s = 1e-6*(data.nbytes+len(rh.header(pulseID,ctime,12345678,data.shape[0])))
-        print "size = ",s, "MB; expected bw = ",s * ctl["rate"], "MB/s"
+        fanout = None
+        if len(self.sockets) > 1:
+            fanout = PulseFanOut(self.sockets,send_data)
+        size = 0
 
-        while(ctl["run"] != "stop"):
-            stream_frequency = 1./ctl["rate"]
+        for pulseID,ts,data in pulses:
+            if ctl["run"] == "stop":
+                break
 
             itime = time.time()
             if ctl["run"] != "pause":
-                dataHeader=rh.header(pulseID,itime,12345678,data.shape[0])
+                dataHeader=rh.header(pulseID,itime,ts,data.shape[0]*self.multiplier)
             else:
-                dataHeader=rh.header(pulseID,itime,12345678,0)
+                dataHeader=rh.header(pulseID,itime,ts,0)
 
 #            data = rh.set_ds(data,ctl)
 
-            def send_data(socket,head):
-                if ctl["run"] == "run": 
-                    socket.send(head,zmq.SNDMORE)
-                    socket.send(self.mutation(ctl,data))
-#                    socket.send(data)
-                    self.count += 1
-                else:
-                    socket.send(head)
-                    self.count += 1
-
-            send_data(self.socket,dataHeader)
-
-            elapsed = time.time() - itime
-            remaining = stream_frequency-elapsed
+            if ctl["run"] == "run": 
+                messages = self.encode(self.mutation(ctl,dataHeader,data))
+            else:
+                messages = [(dataHeader,None)]
 
-            if remaining > 0:
-                time.sleep (remaining)
+            if fanout is None:
+                size += send_data(self.sockets[0],messages)
+                self.count += 1
+            else:
+                fanout.put(messages)
 
-            pulseID += 1
             ctl = rh.control()
             if time.time()-ctime > 10 :
-                size = (data.size*data.dtype.itemsize+
-                        sys.getsizeof(dataHeader))
-
-                print "Sent ",self.count," events @ ",size*self.count/(10.*1e6)," MB/s"
+                if fanout is not None:
+                    self.count,size = fanout.stats()
+
+                print "Sent ",self.count," events @ ",size/(10.*1e6)," MB/s"
+                print "Lateness ",clock.histogram
+                print "Injected faults ",self.injector.stats()
+                if self.codec.name != "none":
+                    print "Compression ",self.codec.name,self.codec.stats()
+                clock.histogram.reset()
                 self.count = 0
+                size = 0
                 ctime = time.time()
 
+        if fanout is not None:
+            fanout.stop()
 
 
 
 
 
 
-def main(argv):
+
+def main(argv,nsockets=1,mock=False,nevents=10000,layout="detector",compression="none",speed=None):
 
     source = argv[0]
     port = argv[1]
@@ -136,13 +190,15 @@ def main(argv):
     if len(argv) > 2:
         multiplier = argv[2]
 
-    generatorSource(source,port,multiplier)
+    generatorSource(source,port,multiplier,nsockets,mock,nevents,layout,compression,speed)
     
 
 
 if __name__ == "__main__":
     try:
-        opts,args = getopt.getopt(sys.argv[1:], "h",["help"])
+        opts,args = getopt.getopt(sys.argv[1:], "hs:t:me:l:c:R:",["help","sockets=","threads=",
+                                                              "mock","events=","layout=","compression=",
+                                                              "replay="])
     except getopt.GetoptError as err:
         print str(err)
         usage()
@@ -152,10 +208,31 @@ if __name__ == "__main__":
         usage()
         exit(2)
         
+    nsockets = 1
+    mock = False
+    nevents = 10000
+    layout = "detector"
+    compression = "none"
+    speed = None
     for o,a in opts:
         if o in ("-h","--help"):
             usage()
             sys.exit()
+        if o in ("-s","--sockets","-t","--threads"):
+            nsockets = int(a)
+        if o in ("-m","--mock"):
+            mock = True
+        if o in ("-e","--events"):
+            nevents = int(a)
+        if o in ("-l","--layout"):
+            layout = a
+        if o in ("-c","--compression"):
+            compression = a
+        if o in ("-R","--replay"):
+            if a == "max":
+                speed = 0.
+            else:
+                speed = float(a)
 
-    main(args)
+    main(args,nsockets,mock,nevents,layout,compression,speed)
 
@@ -1,11 +1,14 @@
 from nexus2event import *
 from neventarray import *
+from eventCache import loadCachedNeXus2event
+from pulseProducer import PulseProducer
+from syntheticEvents import syntheticEvents, layouts
+from pulseCodec import PulseCodec, available
 
 import sys, os, getopt
 import errno
 import numpy
 import time
-import threading
 import psutil
 
 import zmq
@@ -17,10 +20,13 @@ from twisted.internet import reactor
 def usage() :
     print ""
     print "Usage:"
-    print "\tpython",sys.argv[0],"[-h -m -r] <nexus file> <port> (<multiplier>)"
+    print "\tpython",sys.argv[0],"[-h -m -r -e <n> -l <layout> -c <codec>] <nexus file> <port> (<multiplier>)"
     print ""
     print "-h: this help"
-    print "-m: use fake data"
+    print "-m: use synthetic data instead of the NeXus file"
+    print "-e: synthetic events per pulse (default 10000)"
+    print "-l: synthetic layout, one of",", ".join(layouts),"(default detector)"
+    print "-c: compress the pulses, one of",", ".join(available()),"(default none)"
     print "-r: don't wait for external signal to start send data"
     print ""
 
@@ -45,20 +51,26 @@ class generatorSource(LineReceiver):
         if line == "pause" :
             self.status = False
             self.factory.pause()
-        self.sendLine(str(self.factory.count))
+        self.sendLine(str(self.factory.producer.sent))
 
 
 
 class generatorSourceFactory(Factory):
     protocol = generatorSource
 
-    def __init__ (self,source,port,multiplier,mock=False,status=False):
+    def __init__ (self,source,port,multiplier,mock=False,status=False,
+                  nevents=10000,layout="detector",compression="none"):
         self.source = source
         self.port = port
 
-        self.multiplier = multiplier
+        self.multiplier = int(multiplier)
         self.status = status
-        self.data = self.load(mock)
+        self.nevents = nevents
+        self.layout = layout
+        self.pool = list(np.atleast_2d(self.load(mock)))
+        self.data = self.pool[0]
+        self.codec = PulseCodec(compression)
+        self.codec.precompute(self.pool)
 
         self.context = zmq.Context()
 #        mem = psutil.virtual_memory().available
@@ -68,8 +80,8 @@ class generatorSourceFactory(Factory):
 #        prin
 
         self.socket = self.connect()
+        self.producer = PulseProducer(self.socket,self.sendPulse)
 
-        self.count = 0
         if (self.status == True):
             self.status = False
             self.run()
@@ -77,35 +89,27 @@ class generatorSourceFactory(Factory):
 
     def load(self,mock):
         if not mock:
-            data = loadNeXus2event(self.source)
+            data = loadCachedNeXus2event(self.source)
         else:
             data = self.dummy()
 
-        if self.multiplier > 1:
-            data = multiplyNEventArray(data,int(self.multiplier))
-
         print "ready to run"
         return data
 
     def dummy(self):
-        data = np.empty(shape=1,dtype=event_t)
-        data["ts"]=1234
-        data["x"] = 23
-        data["y"] = 4
-        return data
+        return syntheticEvents(self.nevents,layout=self.layout,seed=0)
 
     def connect(self):
         zmq_socket = self.context.socket(zmq.PUSH)
         zmq_socket.bind("tcp://127.0.0.1:"+self.port)
+        zmq_socket.setsockopt(zmq.SNDHWM, 100)
         return zmq_socket
 
     def run(self) :
         if (self.status == False) :
             print "started counting"
             self.status = True
-            thread = threading.Thread(target=self.start)
-            thread.daemon = True
-            thread.start()
+            self.producer.start()
         else :
             print "Nothing to do, I'm already counting!"
             
@@ -116,43 +120,21 @@ class generatorSourceFactory(Factory):
         else :
             print "Nothing to do, I'm already in pause!"
 
-    def start(self):
-        data = self.data
-        ctime=time.time()
-        pulseID=0
-        
-        while True:
-            itime = time.time()
-            dataHeader=header(pulseID,itime)
-            
-            def send_data(socket,head):
-                socket.send_json(head,zmq.SNDMORE)
-                socket.send(self.data)
-                self.count += 1
-
-            if (self.status == True):
-                send_data(self.socket,dataHeader)
-
-            elapsed = time.time() - itime
-            remaining = 1./14-elapsed
-
-            if remaining > 0:
-                time.sleep (remaining)
-
-            pulseID += 1
-
-            if time.time()-ctime > 10 :
-                size = (data.size*event_t.itemsize+
-                        sys.getsizeof(dataHeader))
+    def sendPulse(self,socket,pulseID,flags):
+        if (self.status == False):
+            return None
 
-                print "Sent ",self.count," events @ ",size*self.count/(10.*1e6)," MB/s"
-                self.count = 0
-                ctime = time.time()
+        self.data = self.pool[pulseID % len(self.pool)]
+        dataHeader=self.codec.tagHeader(header(pulseID,time.time(),ne=self.data.size*self.multiplier))
+        frames = self.codec.encodeFrames([self.data])
+        socket.send(dataHeader,flags|zmq.SNDMORE)
+        sendNEventFrames(socket,frames,self.multiplier)
+        return len(dataHeader)+frames[0].nbytes*self.multiplier
 
 
 
 
-def main(argv,mock=False,status=False):
+def main(argv,mock=False,status=False,nevents=10000,layout="detector",compression="none"):
     source = argv[0]
     port = argv[1]
 
@@ -160,12 +142,12 @@ def main(argv,mock=False,status=False):
     if len(argv) > 2:
         multiplier = argv[2]
 
-    reactor.listenTCP(8123, generatorSourceFactory(source,port,multiplier,mock,status))
+    reactor.listenTCP(8123, generatorSourceFactory(source,port,multiplier,mock,status,nevents,layout,compression))
     reactor.run()
 
 if __name__ == "__main__":
     try:
-        opts,args = getopt.getopt(sys.argv[1:], "hmr",["help","mock","run"])
+        opts,args = getopt.getopt(sys.argv[1:], "hmre:l:c:",["help","mock","run","events=","layout=","compression="])
     except getopt.GetoptError as err:
         print str(err)
         usage()
@@ -177,6 +159,9 @@ if __name__ == "__main__":
     
     mock = False
     run = False
+    nevents = 10000
+    layout = "detector"
+    compression = "none"
     for o,a in opts:
         if o in ("-h","--help"):
             usage()
@@ -185,6 +170,12 @@ if __name__ == "__main__":
             mock = True
         if o in ("-r","--run"):
             run = True
+        if o in ("-e","--events"):
+            nevents = int(a)
+        if o in ("-l","--layout"):
+            layout = a
+        if o in ("-c","--compression"):
+            compression = a
             
-    main(args,mock,run)
+    main(args,mock,run,nevents,layout,compression)
 
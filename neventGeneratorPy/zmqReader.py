@@ -5,18 +5,14 @@ import numpy as np
 import json
 import threading
 
-#from neventarray import *
-def multiplyNEventArray(data,multiplier) :
-    return np.tile(data,multiplier)
-
-event_t = np.dtype([("ts",np.uint32),
-                    ("data",np.uint32)])
+from neventarray import *
+from receiverStats import ReceiverStats
+from pulseCodec import decodeFrames
 
 class generatorReceiver :
     def __init__ (self, fulladdress) :
         self.fulladdress = fulladdress
-        self.count = 0
-        self.size = 0
+        self.statistics = ReceiverStats()
         self.context = zmq.Context()
         self.socket = self.connect()
         self.run()
@@ -30,39 +26,39 @@ class generatorReceiver :
     def stats(self) :
         while True:
             time.sleep(10)
-            print "Received",self.count,"events (",self.size/1.e6,"MB) @ ",self.size*self.count/(10.*1e6)," MB/s"
-            self.count = 0
+            statistics,self.statistics = self.statistics,ReceiverStats()
+            print "Received",statistics
 
     def run(self) :
-        pulseID = 0
-
         thread = threading.Thread(target=self.stats)
         thread.daemon = True
         thread.start()
         
         while(True):
 
-            dataHeader = self.socket.recv_json()
-            buf = self.socket.recv(copy=True)
+            message = self.socket.recv()
+            dataHeader = parseHeader(message)
             ne = dataHeader["ds"][1]
+            size = 0
+            nbytes = len(message)
             
-            if zmq.getsockopt(zmq.RECVMORE):
-                data = np.frombuffer(buffer(buf),dtype=event_t)
+            if self.socket.getsockopt(zmq.RCVMORE):
+                frames = recvFrames(self.socket)
+                nbytes += sum([len(f) for f in frames])
+                frames = decodeFrames(dataHeader,frames)
+                size = sum([f.size for f in frames])
             
-                if data.size < ne:
+                if size < ne:
                     print "pulse ",dataHeader["pid"]," incomplete"
 
-                    for i in  data:
-                        print i["ts"], (i["data"] & 0xfff), (i["data"] & 0xfff000) >> 12,(i["data"] & 0xf000000) >> 24,(i["data"] & 0x1000000) >> 28,(i["data"] & 0x2000000) >> 29 ,(i["data"] & 0x4000000) >> 30,(i["data"] & 0x8000000) >> 31
-                
-                
-                    timestamp = dataHeader["st"]
-                    if not int(dataHeader["pid"]) == (pulseID+1):
-                        print "Lost pulse ",dataHeader["pid"]
-                    pulseID = int(dataHeader["pid"])
+                    d = np.concatenate(frames)["data"]
+                    np.savetxt(sys.stdout,
+                               np.column_stack((np.concatenate(frames)["ts"],
+                                                d & 0xfff, (d & 0xfff000) >> 12,(d & 0xf000000) >> 24,
+                                                (d >> 28) & 1,(d >> 29) & 1,(d >> 30) & 1,(d >> 31) & 1)),
+                               fmt="%d")
 
-                    self.size = data.size*event_t.itemsize+sys.getsizeof(dataHeader)
-                    self.count = self.count+1
+            self.statistics.record(dataHeader,nbytes,size)
 
 
 def main(argv):
@@ -0,0 +1,176 @@
+import numpy as np
+from twisted.internet import reactor
+
+class CountModel:
+    """Counts and preset completion of a fake EL737 counter box.
+
+    The counters count with independent Poisson processes of the given
+    rates (counts per second of counting time). Counts are drawn only
+    when they are read, so polling neither costs nor changes anything.
+    Once stream() was called, counter 1, to which a monitor preset
+    refers, counts the streamed events passed to addEvents() instead.
+
+    A count ends on a reactor timer rather than when it is polled: a
+    timer preset after exactly preset seconds of counting time, a
+    monitor preset when the Poisson process of counter 1 reaches it (the
+    time is drawn up front from a gamma distribution and counter 1 is
+    drawn consistently with it until then) or, when streaming, with the
+    pulse whose events reach it. Pauses and missing beam stop the
+    counting time and the timer.
+
+    Args:
+    rates  (list): counts per second of counters 1 to 8
+    seed   (int):  seed of the random draws
+    clock:         the reactor, or a twisted.internet.task.Clock
+    """
+
+    rates = (1000.,1500.,500.,300.,2000.,0.,0.,0.)
+
+    def __init__(self,rates=None,seed=None,clock=reactor):
+        self.rng = np.random.RandomState(seed)
+        self.clock = clock
+        self.rates = np.array(rates or self.rates,dtype=float)
+        self.streamed = False
+        self.mode = 'timer'
+        self.preset = 0.
+        self.counting = False
+        self.paused = False
+        self.nobeam = False
+        self.call = None
+        self.reset()
+
+    def reset(self):
+        self.counts = np.zeros(self.rates.size,dtype=np.int64)
+        self.elapsed = 0.
+        self.resumed = None
+        self.drawn = 0.
+        self.deadline = None
+        self.target = 0
+
+    def running(self):
+        return self.counting and not self.paused and not self.nobeam
+
+    def countTime(self):
+        t = self.elapsed
+        if self.resumed is not None:
+            t += self.clock.seconds()-self.resumed
+        if self.deadline is not None:
+            t = min(t,self.deadline)
+        return t
+
+    def start(self,mode,preset):
+        self.hold()
+        self.reset()
+        self.mode = mode
+        self.preset = preset
+        self.counting = True
+        self.paused = False
+        if mode == 'timer':
+            self.deadline = preset
+        elif not self.streamed:
+            self.drawDeadline()
+        self.release()
+
+    def stop(self):
+        self.hold()
+        self.counting = False
+
+    def pause(self):
+        self.hold()
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        self.release()
+
+    def setBeam(self,beam):
+        self.hold()
+        self.nobeam = not beam
+        self.release()
+
+    def setRates(self,rates):
+        self.hold()
+        self.rates = np.array(rates,dtype=float)
+        if self.counting and self.mode == 'monitor' and not self.streamed:
+            self.drawDeadline()
+        self.release()
+
+    def stream(self,streamed=True):
+        self.hold()
+        self.streamed = streamed
+        if self.counting and self.mode == 'monitor':
+            if streamed:
+                self.deadline = None
+            else:
+                self.drawDeadline()
+        self.release()
+
+    def addEvents(self,n):
+        """Counts n streamed events in counter 1."""
+        if not (self.streamed and self.running()):
+            return
+        self.counts[0] += n
+        if self.mode == 'monitor' and self.counts[0] >= self.preset:
+            self.deadline = self.countTime()
+            self.finish()
+
+    def read(self):
+        """Returns the counting time and the counts so far."""
+        if self.running():
+            self.draw(self.countTime())
+        return self.countTime(),self.counts
+
+    def hold(self):
+        if self.running() and self.resumed is not None:
+            t = self.countTime()
+            self.draw(t)
+            self.elapsed = t
+            self.resumed = None
+            self.cancel()
+
+    def release(self):
+        if self.running() and self.resumed is None:
+            self.resumed = self.clock.seconds()
+            if self.deadline is not None:
+                self.call = self.clock.callLater(max(self.deadline-self.elapsed,0.),self.finish)
+
+    def cancel(self):
+        if self.call is not None and self.call.active():
+            self.call.cancel()
+        self.call = None
+
+    def finish(self):
+        self.cancel()
+        self.draw(self.deadline)
+        self.elapsed = self.deadline
+        self.resumed = None
+        self.counting = False
+
+    def drawDeadline(self):
+        self.target = int(np.ceil(self.preset))
+        left = self.target-self.counts[0]
+        if left <= 0:
+            self.deadline = self.drawn
+        elif self.rates[0] > 0:
+            self.deadline = self.drawn+self.rng.gamma(left,1./self.rates[0])
+        else:
+            self.deadline = None
+
+    def draw(self,t):
+        dt = t-self.drawn
+        if dt <= 0:
+            return
+        first = 0
+        if self.streamed:
+            first = 1
+        elif self.mode == 'monitor' and self.deadline is not None:
+            # knowing when the preset is reached, the arrivals before are
+            # uniformly distributed up to then
+            if t >= self.deadline:
+                self.counts[0] = max(self.counts[0],self.target)
+            else:
+                left = max(self.target-1-self.counts[0],0)
+                self.counts[0] += self.rng.binomial(left,dt/(self.deadline-self.drawn))
+            first = 1
+        self.counts[first:] += self.rng.poisson(self.rates[first:]*dt)
+        self.drawn = t
@@ -0,0 +1,148 @@
+#--------------------------------------------------------------
+# State of many simulated motor axes in NumPy arrays. The
+# protocol front-ends (EL734, Nanotec) keep only their protocol
+# parameters per motor and ask the bank where an axis is.
+#-------------------------------------------------------------
+import numpy as np
+from twisted.internet import reactor
+from trapezoid import Profile
+
+# segments per move, shorter profiles are padded with their last segment
+SEGMENTS = 3
+
+class MotorBank(object):
+    """
+    Positions and moves of any number of axes. A move is a trapezoid
+    Profile stored as a row of segments; the position of an axis is
+    evaluated from it in closed form when asked for. One reactor timer
+    per bank, set to the earliest end of a move, ends all the moves
+    due in one vectorized tick, which also refreshes the position
+    snapshot of every axis.
+    """
+    def __init__(self,clock=reactor,capacity=16):
+        self.clock = clock
+        self.count = 0
+        self.current = np.zeros(capacity)
+        self.segments = np.zeros((capacity,SEGMENTS,4))
+        self.end = np.zeros(capacity)
+        self.final = np.zeros(capacity)
+        self.moving = np.zeros(capacity,dtype=bool)
+        self.flags = np.zeros(capacity,dtype=np.int64)
+        self.done = []
+        self.call = None
+        self.next = None
+
+    def __len__(self):
+        return self.count
+
+    def add(self,position=0.):
+        """Adds an axis at position and returns its index"""
+        if self.count == self.current.size:
+            size = 2*self.count
+            for name in ("current","segments","end","final","moving","flags"):
+                old = getattr(self,name)
+                new = np.zeros((size,)+old.shape[1:],dtype=old.dtype)
+                new[:self.count] = old
+                setattr(self,name,new)
+        axis = self.count
+        self.count += 1
+        self.current[axis] = position
+        self.done.append(None)
+        return axis
+
+    def profile(self,axis):
+        """The move of a moving axis as a Profile"""
+        return Profile([tuple(s) for s in self.segments[axis].tolist()],
+                       float(self.end[axis]),float(self.final[axis]))
+
+    def state(self,axis,t=None):
+        """Position and velocity of an axis"""
+        if not self.moving[axis]:
+            return float(self.current[axis]),0.
+        if t is None:
+            t = self.clock.seconds()
+        if t >= self.end[axis]:
+            return float(self.final[axis]),0.
+        segments = self.segments[axis].tolist()
+        for t0,x0,v0,a in reversed(segments):
+            if t >= t0:
+                dt = t - t0
+                return x0 + (v0 + .5*a*dt)*dt,v0 + a*dt
+        return segments[0][1],0.
+
+    def position(self,axis,t=None):
+        return self.state(axis,t)[0]
+
+    def setPosition(self,axis,position):
+        """Redefines the position of an axis at rest"""
+        if not self.moving[axis]:
+            self.current[axis] = position
+
+    def move(self,axis,profile,done=None):
+        """Starts the move of profile, replacing any move of the axis.
+        done() is called when the move ends, a move which is already
+        over ends at once."""
+        segments = profile.segments + profile.segments[-1:]*(SEGMENTS - len(profile.segments))
+        self.segments[axis] = segments
+        self.end[axis] = profile.end
+        self.final[axis] = profile.final
+        self.moving[axis] = True
+        self.done[axis] = done
+        if profile.end <= self.clock.seconds():
+            self.finish(axis)
+        elif self.next is None or profile.end < self.next:
+            self.schedule(profile.end)
+
+    def stop(self,axis):
+        """Stops an axis at once where it is"""
+        if self.moving[axis]:
+            self.current[axis] = self.position(axis)
+            self.moving[axis] = False
+            self.done[axis] = None
+
+    def finish(self,axis):
+        self.current[axis] = self.final[axis]
+        self.moving[axis] = False
+        done,self.done[axis] = self.done[axis],None
+        if done is not None:
+            done()
+
+    def positions(self,t=None):
+        """Positions of all the axes at time t, in one vectorized step"""
+        if t is None:
+            t = self.clock.seconds()
+        n = self.count
+        segments = self.segments[:n]
+        index = np.maximum((segments[:,:,0] <= t).sum(axis=1) - 1,0)
+        t0,x0,v0,a = segments[np.arange(n),index].T
+        dt = t - t0
+        x = x0 + (v0 + .5*a*dt)*dt
+        x = np.where(t >= self.end[:n],self.final[:n],x)
+        return np.where(self.moving[:n],x,self.current[:n])
+
+    def tick(self):
+        """Ends the moves which are due and refreshes the positions"""
+        self.call = None
+        self.next = None
+        now = self.clock.seconds()
+        self.current[:self.count] = self.positions(now)
+        for axis in np.flatnonzero(self.moving[:self.count] & (self.end[:self.count] <= now)):
+            if self.moving[axis] and self.end[axis] <= now:
+                self.finish(axis)
+        moving = self.moving[:self.count]
+        if moving.any():
+            self.schedule(self.end[:self.count][moving].min())
+
+    def schedule(self,t):
+        if self.call is not None and self.call.active():
+            self.call.cancel()
+        self.next = t
+        self.call = self.clock.callLater(max(t - self.clock.seconds(),0.),self.tick)
+
+banks = {}
+
+def sharedBank(clock=reactor):
+    """The bank of all the motors of this process running on clock"""
+    if clock not in banks:
+        banks[clock] = MotorBank(clock)
+    return banks[clock]
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# vim: ts=8 sts=4 sw=4 expandtab
+#
+# Runs all the simulated devices of an instrument in one process, with
+# one reactor, instead of one interpreter per device.
+#
+# The instrument is described by an INI file, either the sics_config.ini
+# edited by config_edit.py or a file of its own. Every section with a
+# simulator key is a device:
+#
+#   [tasmot]
+#   simulator = el734
+#   port = 61000
+#   init = tasmot.ini
+#
+#   [sample_temp]
+#   simulator = ls336
+#   port = 7336
+#
+# Implementation sections of a sics_config.ini are started only when an
+# enabled configuration option selects them, other sections unless they
+# have enabled = false. init is a file relative to the INI file, for the
+# simulators which load one (el734, nanotec); baud and turnaround (ms)
+# give a nanotec the timing of its RS-485 bus. Which simulators there
+# are is shown by -h.
+#
+# Every device module is loaded once per device, so the module globals
+# of the simulators (like the connection list of nhq) are per device as
+# with separate processes, and so are their loggers: SIMLOG=<section>=debug
+# logs the traffic of one device (see simlog.py). The motors of all the
+# el734 and nanotec devices move in one shared MotorBank. The periodic
+# iterations of all devices with the same interval run from one shared
+# LoopingCall. With -w the devices are spread over that many processes.
+#
+import ConfigParser
+import getopt
+import imp
+import os
+import sys
+
+from twisted.internet import reactor, protocol
+from twisted.internet.task import LoopingCall
+
+top = os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(top, "util"))
+from simlog import getLogger, setDevice
+
+log = getLogger("simhost")
+
+class Ticker(object):
+    """Calls all the functions registered with the same interval from one
+    LoopingCall; an exception in one of them does not stop the others"""
+
+    def __init__(self):
+        self.calls = {}
+        self.loops = {}
+
+    def add(self, interval, f):
+        if interval not in self.calls:
+            self.calls[interval] = []
+            self.loops[interval] = LoopingCall(self.tick, interval)
+        self.calls[interval].append(f)
+
+    def tick(self, interval):
+        for f in self.calls[interval]:
+            try:
+                f()
+            except Exception as e:
+                log.error("Tick of %s failed: %s", f, e)
+
+    def start(self):
+        for interval, loop in self.loops.items():
+            loop.start(interval)
+
+def loadModule(name, path):
+    """Loads the simulator module at path (relative to the top of the
+    repository) as a module of its own named name"""
+    path = os.path.join(top, path)
+    directory = os.path.dirname(path)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    return imp.load_source(name, path)
+
+def sharedModule(path):
+    """Imports the module at path once for all devices"""
+    path = os.path.join(top, path)
+    directory = os.path.dirname(path)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    return __import__(os.path.splitext(os.path.basename(path))[0])
+
+def lineServer(path, cls, port):
+    """Simulators which are a protocol class served by a ServerFactory"""
+    def build(name, options):
+        module = loadModule(name, path)
+        factory = protocol.ServerFactory()
+        factory.protocol = getattr(module, cls)
+        return factory, []
+    return build, port
+
+def el734(name, options):
+    module = loadModule(name, "fakeEL734/el734controller.py")
+    return module.EL734Factory(options.get("init")), []
+
+def nanotec(name, options):
+    if "init" not in options:
+        raise ValueError("nanotec %s needs an init file" % name)
+    module = loadModule(name, "fakeNanotec/nanotecController.py")
+    bus = module.RS485Bus(int(options.get("baud", 0)) or None,
+                          float(options.get("turnaround", 2))/1000.)
+    return module.NanotecFactory(options["init"], bus), []
+
+def el737generator(name, options):
+    module = loadModule(name, "fakeEL737/el737generator.py")
+    return module.EL737Factory(), []
+
+def sinqchopper(name, options):
+    module = loadModule(name, "fakeDChopper/SIM_SINQ.py")
+    return module.ChopperFactory(), []
+
+def nhq(name, options):
+    module = loadModule(name, "fakeNHQ/fakeNHQ.py")
+    factory = protocol.ServerFactory()
+    factory.protocol = module.NHQ_200
+    return factory, [(1.0, module.device_iterator)]
+
+def temperature(path, cls, factoryPath, factoryCls, protocolPath, protocolCls, port):
+    """Lakeshore and Mercury controllers, whose device object lives as
+    long as the simulator and is iterated every 250 ms"""
+    def build(name, options):
+        device = getattr(loadModule(name, path), cls)()
+        factory = getattr(sharedModule(factoryPath), factoryCls)
+        proto = getattr(sharedModule(protocolPath), protocolCls)
+        return factory(proto, device, "\r"), [(0.250, device.doIteration)]
+    return build, port
+
+simulators = {
+    "el734": (el734, 61000),
+    "el737": lineServer("fakeEL737/el737counter.py", "EL737Controller", 62000),
+    "el737generator": (el737generator, 62000),
+    "nanotec": (nanotec, None),
+    "sps": lineServer("fakeSPS/spss5.py", "SPSS5", 63000),
+    "nhq": (nhq, 60000),
+    "astrium": lineServer("fakeDChopper/SIM_ASTRIUM.py", "Astrium_Chopper", 60000),
+    "sinqchopper": (sinqchopper, 60000),
+    "dimetix": lineServer("fakeDimetix/dimetix.py", "Dimetix", 64000),
+    "slsvme": lineServer("fakeMagnet/SLSVME.py", "SLSVME", 6666),
+    "nvs": lineServer("fakeNVS/SIM_NVS.py", "NVS_Prot", 60001),
+    "sinqnvs": lineServer("fakeNVS/SIM_SINQ.py", "Astrium_NVS", 5050),
+    "ls336": temperature("fakeTempControl/lakeshore/Lakeshore336.py", "Lakeshore336",
+                         "fakeTempControl/lakeshore/LakeshoreFactory.py", "LakeshoreFactory",
+                         "fakeTempControl/lakeshore/LakeshoreProtocol.py", "LakeshoreProtocol", 7336),
+    "ls340": temperature("fakeTempControl/lakeshore/Lakeshore340.py", "Lakeshore340",
+                         "fakeTempControl/lakeshore/LakeshoreFactory.py", "LakeshoreFactory",
+                         "fakeTempControl/lakeshore/LakeshoreProtocol.py", "LakeshoreProtocol", 7340),
+    "ls370": temperature("fakeTempControl/lakeshore/Lakeshore370.py", "Lakeshore370",
+                         "fakeTempControl/lakeshore/LakeshoreFactory.py", "LakeshoreFactory",
+                         "fakeTempControl/lakeshore/LakeshoreProtocol.py", "LakeshoreProtocol", 7370),
+    "mercury": temperature("fakeTempControl/oxford/MercurySCPI.py", "MercurySCPI",
+                           "fakeTempControl/oxford/MercuryFactory.py", "MercuryFactory",
+                           "fakeTempControl/oxford/MercuryProtocol.py", "MercuryProtocol", 7020),
+}
+
+def readInstrument(filename):
+    """Returns the devices of an instrument file as a list of (section,
+    simulator, port, options) in the order of the file"""
+    parser = ConfigParser.SafeConfigParser()
+    parser.optionxform = str
+    if not parser.read(filename):
+        raise IOError("Cannot read " + filename)
+
+    selected = set()
+    for sect in parser.sections():
+        if parser.has_option(sect, "implementation") and parser.has_option(sect, "enabled"):
+            if parser.get(sect, "enabled").lower() in ("true", "always"):
+                selected.add(parser.get(sect, "implementation"))
+
+    devices = []
+    for sect in parser.sections():
+        if not parser.has_option(sect, "simulator"):
+            continue
+        if parser.has_option(sect, "imptype"):
+            if sect not in selected:
+                continue
+        elif parser.has_option(sect, "enabled") and parser.get(sect, "enabled").lower() == "false":
+            continue
+
+        options = dict(parser.items(sect))
+        kind = options.pop("simulator")
+        if kind not in simulators:
+            raise ValueError("Unknown simulator %s for %s" % (kind, sect))
+        if "init" in options:
+            options["init"] = os.path.join(os.path.dirname(os.path.abspath(filename)), options["init"])
+        port = options.pop("port", simulators[kind][1])
+        if port is None:
+            raise ValueError("No port for %s" % sect)
+        devices.append((sect, kind, int(port), options))
+    return devices
+
+def startDevices(devices, ticker):
+    for sect, kind, port, options in devices:
+        # the loggers made while building are named for the device
+        setDevice(sect)
+        try:
+            factory, ticks = simulators[kind][0]("sim_" + sect, options)
+        finally:
+            setDevice(None)
+        for interval, f in ticks:
+            ticker.add(interval, f)
+        reactor.listenTCP(port, factory)
+        log.info("%s: %s on port %d", sect, kind, port)
+
+def spawnWorkers(filename, workers):
+    """Starts workers - 1 more hosts of the instrument, each serving its
+    share of the devices, and stops them with this one"""
+    children = []
+    for share in range(1, workers):
+        argv = [sys.executable, os.path.abspath(__file__),
+                "-w", str(workers), "-s", str(share), filename]
+        children.append(reactor.spawnProcess(protocol.ProcessProtocol(), sys.executable, argv,
+                                             env=os.environ, childFDs={0: 0, 1: 1, 2: 2}))
+
+    def stopChildren():
+        for child in children:
+            try:
+                child.signalProcess("TERM")
+            except Exception:
+                pass
+    reactor.addSystemEventTrigger("before", "shutdown", stopChildren)
+
+def usage():
+    print ""
+    print "Usage:"
+    print "\tpython", sys.argv[0], "[-h -l -w <workers>] <instrument file>"
+    print ""
+    print "-h: this help"
+    print "-l: only list the devices of the instrument"
+    print "-w: spread the devices over this many processes (default 1)"
+    print ""
+    print "Simulators:", ", ".join(sorted(simulators.keys()))
+    print ""
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv[1:], "hlw:s:", ["help", "list", "workers=", "share="])
+    except getopt.GetoptError as err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    workers = 1
+    share = None
+    listOnly = False
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit()
+        if o in ("-l", "--list"):
+            listOnly = True
+        if o in ("-w", "--workers"):
+            workers = max(int(a), 1)
+        if o in ("-s", "--share"):
+            share = int(a)
+
+    if len(args) != 1:
+        usage()
+        sys.exit(2)
+
+    devices = readInstrument(args[0])
+    if listOnly:
+        for sect, kind, port, options in devices:
+            print sect, kind, port, " ".join("%s=%s" % o for o in sorted(options.items()))
+        return
+
+    if share is None:
+        share = 0
+        if workers > 1:
+            spawnWorkers(args[0], workers)
+    devices = devices[share::workers]
+
+    ticker = Ticker()
+    startDevices(devices, ticker)
+    ticker.start()
+    reactor.run()
+
+if __name__ == "__main__":
+    main(sys.argv)
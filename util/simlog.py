@@ -0,0 +1,192 @@
+# vim: ts=8 sts=4 sw=4 expandtab
+#
+# Logging for the device simulators
+#
+# Every simulator gets its logger by name, e.g. getLogger("el734"), and
+# logs with a format string and its arguments, which are only formatted
+# when the message is actually written. What is written is chosen with
+# the SIMLOG environment variable, a comma separated list of level or
+# name=level, where level is one of debug, info, warning, error, off or
+# trace, and a name also covers the loggers below it (el734 covers
+# el734.motor):
+#
+#   SIMLOG=debug                      everything
+#   SIMLOG=warning,el734=debug        only el734 in detail
+#   SIMLOG=lakeshore=off,nanotec=trace
+#
+# In simhost, which runs many devices in one process, the name of the
+# device (its section in the instrument file) follows the kind in the
+# names of its loggers, e.g. el734.tasmot and el734.tasmot.motor. Then
+# el734.tasmot=debug or just tasmot=debug selects that one device, and
+# el734=debug still selects all el734s.
+#
+# The default is info: the line by line traffic of the simulators is
+# logged at debug and therefore not written. A logger at trace keeps
+# all of its messages unformatted in a ring buffer of SIMLOG_TRACE
+# (default 10000) entries instead of writing them, warnings and errors
+# are still written. The ring buffer is dumped to stderr on SIGUSR1 or
+# with dump().
+#
+import os
+import signal
+import sys
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+levels = {"debug": DEBUG, "info": INFO, "warning": WARNING,
+          "error": ERROR, "off": OFF}
+names = dict((v, k.upper()) for k, v in levels.items())
+
+class Trace(object):
+    """Ring buffer of the last size messages of the tracing loggers"""
+
+    def __init__(self, size=10000):
+        self.records = [None] * size
+        self.next = 0
+
+    def record(self, name, level, fmt, args):
+        self.records[self.next % len(self.records)] = (time.time(), name, level, fmt, args)
+        self.next += 1
+
+    def dump(self, out=None):
+        if out is None:
+            out = sys.stderr
+        size = len(self.records)
+        for i in range(max(self.next - size, 0), self.next):
+            t, name, level, fmt, args = self.records[i % size]
+            out.write("%s.%03d %s %s: %s\n" % (
+                time.strftime("%H:%M:%S", time.localtime(t)), int(t * 1000) % 1000,
+                names[level], name, formatMessage(fmt, args)))
+        out.flush()
+
+def formatMessage(fmt, args):
+    if not args:
+        return fmt
+    try:
+        return fmt % args
+    except (TypeError, ValueError):
+        return "%s %r" % (fmt, args)
+
+class Logger(object):
+    """Logger of one simulated device, see the module comment. Checking
+    enabled() first avoids computing expensive arguments for nothing."""
+
+    def __init__(self, name, device=None):
+        self.name = name
+        self.device = device
+        self.level = INFO
+        self.tracing = False
+
+    def getChild(self, suffix):
+        """The logger named suffix below this one, of the same device"""
+        return namedLogger(self.name + "." + suffix, self.device)
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def setLevel(self, level):
+        if level == "trace":
+            self.level = DEBUG
+            self.tracing = True
+            installDumpHandler()
+        else:
+            self.level = levels.get(level, level)
+            self.tracing = False
+
+    def log(self, level, fmt, *args):
+        if level < self.level:
+            return
+        if self.tracing:
+            trace.record(self.name, level, fmt, args)
+            if level < WARNING:
+                return
+        sys.stdout.write("%s: %s\n" % (self.name, formatMessage(fmt, args)))
+
+    def debug(self, fmt, *args):
+        if DEBUG >= self.level:
+            self.log(DEBUG, fmt, *args)
+
+    def info(self, fmt, *args):
+        if INFO >= self.level:
+            self.log(INFO, fmt, *args)
+
+    def warning(self, fmt, *args):
+        if WARNING >= self.level:
+            self.log(WARNING, fmt, *args)
+
+    def error(self, fmt, *args):
+        if ERROR >= self.level:
+            self.log(ERROR, fmt, *args)
+
+loggers = {}
+settings = {}
+trace = Trace(int(os.environ.get("SIMLOG_TRACE", 10000)))
+dumpHandler = False
+# the device getLogger names the loggers for, see setDevice()
+device = None
+
+def installDumpHandler():
+    global dumpHandler
+    if dumpHandler:
+        return
+    try:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: trace.dump())
+        dumpHandler = True
+    except (AttributeError, ValueError):
+        # no SIGUSR1 on this platform, or not in the main thread
+        pass
+
+def settingFor(name, device=None):
+    parts = name.split(".")
+    candidates = [".".join(parts[:i]) for i in range(len(parts), 0, -1)]
+    if device is not None:
+        # after the loggers of the device, before those of its kind
+        candidates.insert(len(candidates) - 1, device)
+    for candidate in candidates:
+        if candidate in settings:
+            return settings[candidate]
+    return settings.get("", "info")
+
+def configure(spec):
+    """Applies a SIMLOG specification to all loggers, also those created
+    before; raises ValueError for an unknown level"""
+    settings.clear()
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, level = item.rpartition("=")
+        level = level.strip().lower()
+        if level not in levels and level != "trace":
+            raise ValueError("Unknown log level " + level)
+        settings[name.strip()] = level
+    for name, logger in loggers.items():
+        logger.setLevel(settingFor(name, logger.device))
+
+def setDevice(name):
+    """Makes getLogger name the loggers for the device name, None for
+    no device. simhost sets it while it builds a device."""
+    global device
+    device = name
+
+def getLogger(name):
+    if device is None:
+        return namedLogger(name, None)
+    kind, _, rest = name.partition(".")
+    return namedLogger(".".join(p for p in (kind, device, rest) if p), device)
+
+def namedLogger(name, device):
+    if name not in loggers:
+        loggers[name] = Logger(name, device)
+        loggers[name].setLevel(settingFor(name, device))
+    return loggers[name]
+
+def dump(out=None):
+    trace.dump(out)
+
+configure(os.environ.get("SIMLOG", ""))
@@ -0,0 +1,71 @@
+#--------------------------------------------------------------
+# Trapezoidal velocity profile of a stepper motor move. The
+# position is evaluated in closed form at any time, so a motor
+# need not be iterated to know where it is.
+#-------------------------------------------------------------
+import math
+
+class Profile(object):
+    """
+    Motion in steps as a list of (time, position, velocity,
+    acceleration) segments, each lasting until the next one starts,
+    and the position reached at end
+    """
+    def __init__(self,segments,end,final):
+        self.segments = segments
+        self.end = end
+        self.final = final
+
+    def state(self,t):
+        """Position and velocity at time t"""
+        if t >= self.end:
+            return self.final,0.
+        for t0,x0,v0,a in reversed(self.segments):
+            if t >= t0:
+                dt = t - t0
+                return x0 + (v0 + .5*a*dt)*dt,v0 + a*dt
+        t0,x0,v0,a = self.segments[0]
+        return x0,0.
+
+    def position(self,t):
+        return self.state(t)[0]
+
+def trapezoid(t,start,target,vmax,vstart=0.,accel=0.):
+    """The move from start to target beginning at time t: it starts
+    at the start/stop speed vstart, accelerates with accel up to vmax,
+    runs and decelerates in time to stop on target. Short moves do not
+    reach vmax, without acceleration the motor runs at vmax all the
+    way."""
+    distance = abs(target - start)
+    sign = 1. if target >= start else -1.
+    vmax = float(vmax)
+    if distance == 0 or vmax <= 0:
+        return Profile([(t,start,0.,0.)],t,target)
+
+    vstart = min(vstart,vmax)
+    if accel <= 0 or vmax <= vstart:
+        return Profile([(t,start,sign*vmax,0.)],t + distance/vmax,target)
+
+    ramp = (vmax*vmax - vstart*vstart)/(2.*accel)
+    if 2*ramp > distance:
+        ramp = distance/2.
+        vmax = math.sqrt(vstart*vstart + accel*distance)
+    tramp = (vmax - vstart)/accel
+    trun = (distance - 2*ramp)/vmax
+    segments = [(t,start,sign*vstart,sign*accel),
+                (t + tramp,start + sign*ramp,sign*vmax,0.),
+                (t + tramp + trun,target - sign*ramp,sign*vmax,-sign*accel)]
+    return Profile(segments,t + 2*tramp + trun,target)
+
+def halt(profile,t,vstart=0.,accel=0.):
+    """Stops the move of profile at time t: the motor decelerates down
+    to the start/stop speed vstart, or stops at once without
+    acceleration"""
+    x,v = profile.state(t)
+    speed = abs(v)
+    if accel <= 0 or speed <= vstart:
+        return Profile([(t,x,0.,0.)],t,x)
+    sign = 1. if v > 0 else -1.
+    tramp = (speed - vstart)/accel
+    final = x + sign*(speed + vstart)*tramp/2.
+    return Profile([(t,x,v,-sign*accel)],t + tramp,final)